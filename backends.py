@@ -0,0 +1,406 @@
+# ═════════════════════════════════════════════════════════════════
+# 🌿 PLANT RECOGNITION BOT - BACKEND POOL
+# ═════════════════════════════════════════════════════════════════
+# Пул API-бэкендов с маршрутизацией по задержке и доле ошибок
+# ═════════════════════════════════════════════════════════════════
+
+import os
+import json
+import time
+import random
+import threading
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import List, Optional, Tuple
+
+
+FAKE_SCHEME = "fake://"
+
+# Нижняя граница задержки при расчете доли трафика: быстрые (или
+# фейковые) бэкенды с задержкой около нуля не должны забирать весь поток
+MIN_LATENCY = 0.05
+
+# Ответы 4xx, при которых есть смысл пробовать другой бэкенд: проблема
+# в ключе или квоте бэкенда, а не в самом запросе
+FAILOVER_STATUS_CODES = {401, 403, 408, 409, 429}
+
+
+def _is_request_error(error: Exception) -> bool:
+    """Ошибка в самом запросе (4xx), которую другой бэкенд не исправит"""
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in FAILOVER_STATUS_CODES
+
+DEFAULT_BASE_URL = "https://api.perplexity.ai"
+DEFAULT_MODEL = "sonar"
+
+
+_env_loaded = False
+
+
+def load_env():
+    """
+    Загружает переменные окружения из .env (один раз на процесс)
+
+    Вызывается при создании пула, поэтому worker процессам, которые
+    используют IdentifierAgent напрямую, не нужно загружать .env самим.
+    Без python-dotenv используются только переменные окружения процесса.
+    """
+    global _env_loaded
+    if _env_loaded:
+        return
+    _env_loaded = True
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv()
+
+
+@dataclass
+class BackendConfig:
+    """Конфигурация одного бэкенда"""
+    name: str
+    api_key: str
+    base_url: str = DEFAULT_BASE_URL
+    model: str = DEFAULT_MODEL
+    weight: float = 1.0
+
+
+class FakeClient:
+    """
+    Локальный фейковый эндпоинт для тестирования (base_url вида fake://...)
+
+    Повторяет интерфейс client.chat.completions.create у OpenAI клиента
+    и возвращает фиксированный JSON ответ без обращения к сети.
+    """
+
+    RESPONSE = {
+        "common_name": "Тестовое растение",
+        "scientific_name": "Plantae fakeus",
+        "family": "Fakeaceae",
+        "organism_type": "растение",
+        "confidence": "высокий",
+        "characteristics": ["Ответ локального фейкового эндпоинта"],
+        "habitat": "localhost",
+        "edibility": "неизвестно",
+        "interesting_facts": ["Запрос не покидал машину"]
+    }
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        text = json.dumps(self.RESPONSE, ensure_ascii=False)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+            usage=SimpleNamespace(total_tokens=0)
+        )
+
+
+class Backend:
+    """Бэкенд пула: конфигурация, клиент и скользящая статистика"""
+
+    def __init__(self, config: BackendConfig, client_factory):
+        self.config = config
+        self._client = None
+        self._client_factory = client_factory
+        self._client_lock = threading.Lock()
+        self.latency_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+
+    @property
+    def name(self) -> str:
+        return self.config.name
+
+    @property
+    def client(self):
+        """Клиент создается при первом использовании"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = self._client_factory(self.config)
+        return self._client
+
+    def is_healthy(self, now: float) -> bool:
+        """Бэкенд доступен, если не исключен из пула"""
+        return now >= self.ejected_until
+
+    def score(self, error_penalty: float) -> float:
+        """Оценка бэкенда: меньше - лучше"""
+        latency = self.latency_ewma if self.latency_ewma is not None else 0.0
+        weight = self.config.weight if self.config.weight > 0 else 1e-6
+        return latency * (1.0 + error_penalty * self.error_ewma) / weight
+
+    def share(self, error_penalty: float, default_latency: float) -> float:
+        """
+        Относительная доля трафика: вес, деленный на ожидаемую стоимость запроса
+
+        Бэкенд без замеров получает задержку default_latency (обычно
+        среднюю по пулу), чтобы сразу участвовать в распределении.
+        """
+        latency = self.latency_ewma if self.latency_ewma is not None else default_latency
+        latency = max(latency, MIN_LATENCY)
+        weight = max(self.config.weight, 0.0)
+        return weight / (latency * (1.0 + error_penalty * self.error_ewma))
+
+
+class BackendPool:
+    """
+    Пул бэкендов с маршрутизацией по EWMA задержки и доли ошибок
+
+    Первый бэкенд для запроса выбирается случайно с вероятностью,
+    пропорциональной весу и обратной EWMA задержки с штрафом за ошибки,
+    так что трафик (и квота ключей) делится между всеми здоровыми
+    бэкендами. При ошибке пробуются остальные в порядке оценки. Бэкенд
+    исключается из пула на время cooldown, если подряд падает несколько
+    запросов или доля ошибок слишком высока.
+    """
+
+    def __init__(
+        self,
+        configs: List[BackendConfig],
+        alpha: float = 0.3,
+        error_penalty: float = 4.0,
+        max_error_rate: float = 0.5,
+        max_consecutive_failures: int = 3,
+        cooldown: float = 30.0,
+        max_cooldown: float = 300.0
+    ):
+        if not configs:
+            raise ValueError("❌ Не задан ни один бэкенд")
+
+        self.alpha = alpha
+        self.error_penalty = error_penalty
+        self.max_error_rate = max_error_rate
+        self.max_consecutive_failures = max_consecutive_failures
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self.backends = [Backend(config, self._make_client) for config in configs]
+
+    # ═════════════════════════════════════════════════════════════════
+    # ⚙️ КОНФИГУРАЦИЯ
+    # ═════════════════════════════════════════════════════════════════
+
+    @classmethod
+    def from_env(cls) -> "BackendPool":
+        """
+        Создает пул из переменных окружения
+
+        PERPLEXITY_BACKENDS - JSON список объектов с полями
+        name, api_key, base_url, model, weight. Если не задан,
+        используется один бэкенд из PERPLEXITY_API_KEY.
+        """
+        load_env()
+        return cls(cls.configs_from_env())
+
+    @staticmethod
+    def configs_from_env() -> List[BackendConfig]:
+        """Читает конфигурации бэкендов из окружения"""
+        raw = os.getenv("PERPLEXITY_BACKENDS")
+        if raw:
+            try:
+                items = json.loads(raw)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"❌ PERPLEXITY_BACKENDS содержит невалидный JSON: {e}")
+
+            configs = []
+            for i, item in enumerate(items):
+                base_url = item.get("base_url", DEFAULT_BASE_URL)
+                api_key = item.get("api_key", "")
+                if not api_key and not base_url.startswith(FAKE_SCHEME):
+                    raise ValueError(f"❌ У бэкенда #{i} не указан api_key")
+                configs.append(BackendConfig(
+                    name=item.get("name", f"backend-{i}"),
+                    api_key=api_key,
+                    base_url=base_url,
+                    model=item.get("model", DEFAULT_MODEL),
+                    weight=float(item.get("weight", 1.0))
+                ))
+            return configs
+
+        api_key = os.getenv("PERPLEXITY_API_KEY")
+        if not api_key or api_key == "pplx-your_api_key_here":
+            raise ValueError("❌ PERPLEXITY_API_KEY не установлен! Установите в .env файл")
+
+        return [BackendConfig(
+            name="perplexity",
+            api_key=api_key,
+            base_url=os.getenv("PERPLEXITY_BASE_URL", DEFAULT_BASE_URL),
+            model=os.getenv("PERPLEXITY_MODEL", DEFAULT_MODEL)
+        )]
+
+    @staticmethod
+    def _make_client(config: BackendConfig):
+        """Создает клиент для бэкенда"""
+        if config.base_url.startswith(FAKE_SCHEME):
+            return FakeClient(config.base_url)
+
+        try:
+            from openai import OpenAI
+            return OpenAI(
+                api_key=config.api_key,
+                base_url=config.base_url,
+                timeout=float(os.getenv("API_TIMEOUT", 60)),
+                # Повторы и переход на другой бэкенд делает пул, а не SDK
+                max_retries=0
+            )
+        except ImportError:
+            raise ImportError("❌ openai не установлен. Запустите: pip install openai")
+        except Exception as e:
+            raise Exception(f"❌ Ошибка инициализации {config.name}: {str(e)}")
+
+    # ═════════════════════════════════════════════════════════════════
+    # 🔀 МАРШРУТИЗАЦИЯ
+    # ═════════════════════════════════════════════════════════════════
+
+    def _ranked(self) -> List[Backend]:
+        """
+        Возвращает бэкенды в порядке попыток
+
+        Первый выбирается взвешенным случайным выбором, остальные
+        идут по возрастанию оценки и используются только при ошибке.
+        """
+        now = time.monotonic()
+        with self._lock:
+            healthy = [b for b in self.backends if b.is_healthy(now)]
+            if not healthy:
+                # Все исключены - пробуем тот, что вернется раньше остальных
+                return sorted(self.backends, key=lambda b: b.ejected_until)
+
+            measured = [b.latency_ewma for b in healthy if b.latency_ewma is not None]
+            default_latency = sum(measured) / len(measured) if measured else MIN_LATENCY
+            shares = [b.share(self.error_penalty, default_latency) for b in healthy]
+
+            if sum(shares) > 0:
+                first = self._random.choices(healthy, weights=shares)[0]
+            else:
+                first = self._random.choice(healthy)
+
+            failover = sorted(
+                (b for b in healthy if b is not first),
+                key=lambda b: (b.latency_ewma is not None, b.score(self.error_penalty))
+            )
+            return [first] + failover
+
+    def record(self, backend: Backend, latency: float, ok: bool):
+        """Обновляет статистику бэкенда после запроса"""
+        with self._lock:
+            if backend.latency_ewma is None:
+                backend.latency_ewma = latency
+            else:
+                backend.latency_ewma += self.alpha * (latency - backend.latency_ewma)
+            backend.error_ewma += self.alpha * ((0.0 if ok else 1.0) - backend.error_ewma)
+
+            if ok:
+                backend.consecutive_failures = 0
+                backend.ejections = 0
+                return
+
+            backend.consecutive_failures += 1
+            if not backend.is_healthy(time.monotonic()):
+                return
+            if (backend.consecutive_failures >= self.max_consecutive_failures
+                    or backend.error_ewma >= self.max_error_rate):
+                self._eject(backend)
+
+    def _eject(self, backend: Backend):
+        """Исключает бэкенд из пула с экспоненциальным cooldown"""
+        cooldown = min(self.cooldown * (2 ** backend.ejections), self.max_cooldown)
+        backend.ejected_until = time.monotonic() + cooldown
+        backend.ejections += 1
+        backend.consecutive_failures = 0
+        print(f"⚠️  Бэкенд {backend.name} исключен на {cooldown:.0f} сек")
+
+    def complete(self, **kwargs) -> Tuple[object, Backend]:
+        """
+        Выполняет chat completion на выбранном бэкенде с переходом на остальные при ошибке
+
+        Параметр model подставляется из конфигурации бэкенда. Ошибки 4xx
+        в самом запросе (кроме авторизации, таймаута и 429) пробрасываются
+        сразу, без перехода на другие бэкенды.
+
+        Returns:
+            (ответ API, бэкенд, который его вернул)
+        """
+        last_error: Optional[Exception] = None
+
+        for backend in self._ranked():
+            start = time.monotonic()
+            try:
+                response = backend.client.chat.completions.create(
+                    model=backend.config.model,
+                    **kwargs
+                )
+            except Exception as e:
+                if _is_request_error(e):
+                    # Некорректный запрос упадет на любом бэкенде и не говорит о его здоровье
+                    raise
+                self.record(backend, time.monotonic() - start, ok=False)
+                print(f"⚠️  Бэкенд {backend.name} вернул ошибку: {str(e)[:100]}")
+                last_error = e
+                continue
+
+            self.record(backend, time.monotonic() - start, ok=True)
+            return response, backend
+
+        raise last_error or RuntimeError("Нет доступных бэкендов")
+
+    # ═════════════════════════════════════════════════════════════════
+    # 🩺 ПРОВЕРКА ЗДОРОВЬЯ
+    # ═════════════════════════════════════════════════════════════════
+
+    def health_check(self) -> List[Tuple[str, bool, str]]:
+        """
+        Проверяет все бэкенды минимальным запросом (параллельно)
+
+        Упавшие бэкенды сразу исключаются из пула.
+
+        Returns:
+            Список (имя, доступен, описание)
+        """
+        if len(self.backends) == 1:
+            return [self._check_backend(self.backends[0])]
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(self.backends)) as executor:
+            return list(executor.map(self._check_backend, self.backends))
+
+    def _check_backend(self, backend: Backend) -> Tuple[str, bool, str]:
+        """Проверяет один бэкенд"""
+        start = time.monotonic()
+        try:
+            backend.client.chat.completions.create(
+                model=backend.config.model,
+                messages=[{"role": "user", "content": "ping"}],
+                max_tokens=1
+            )
+        except Exception as e:
+            with self._lock:
+                self._eject(backend)
+            return backend.name, False, str(e)[:100]
+
+        latency = time.monotonic() - start
+        self.record(backend, latency, ok=True)
+        return backend.name, True, f"{latency * 1000:.0f} мс"
+
+    def stats(self) -> List[dict]:
+        """Снимок статистики бэкендов"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "name": b.name,
+                    "model": b.config.model,
+                    "weight": b.config.weight,
+                    "latency_ewma": b.latency_ewma,
+                    "error_ewma": b.error_ewma,
+                    "healthy": b.is_healthy(now)
+                }
+                for b in self.backends
+            ]
@@ -0,0 +1,100 @@
+# ═════════════════════════════════════════════════════════════════
+# 🌿 PLANT RECOGNITION BOT - IMPORT TIME BENCHMARK
+# ═════════════════════════════════════════════════════════════════
+# Замер времени импорта с бюджетом (python -X importtime)
+# ═════════════════════════════════════════════════════════════════
+#
+# Использование:
+#   python bench_import.py                    # bot, бюджет по умолчанию
+#   python bench_import.py --module identifier --budget-ms 40
+#
+# Код возврата 1, если медиана превышает бюджет или при импорте
+# загрузился модуль, который должен импортироваться лениво.
+# ═════════════════════════════════════════════════════════════════
+
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+from typing import Dict, Tuple
+
+
+# Модули, которые не должны загружаться при импорте бота
+LAZY_MODULES = ("telegram", "openai", "dotenv", "handlers", "dispatcher", "profiler", "asyncio")
+
+DEFAULT_BUDGET_MS = 100.0
+
+
+def measure(module: str) -> Tuple[float, Dict[str, float]]:
+    """
+    Импортирует модуль в чистом интерпретаторе
+
+    Returns:
+        (время импорта модуля в мс, {модуль: суммарное время в мс})
+    """
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=repo_dir,
+        capture_output=True,
+        text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Импорт {module} упал:\n{proc.stderr[-2000:]}")
+
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(cumulative_us) / 1000
+    return cumulative[module], cumulative
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк времени импорта")
+    parser.add_argument("--module", default="bot", help="модуль для импорта")
+    parser.add_argument("--runs", type=int, default=7, help="количество запусков")
+    parser.add_argument(
+        "--budget-ms", type=float,
+        default=float(os.getenv("IMPORT_BUDGET_MS", DEFAULT_BUDGET_MS)),
+        help="бюджет на медиану времени импорта, мс"
+    )
+    parser.add_argument("--top", type=int, default=10, help="сколько самых тяжелых модулей показать")
+    args = parser.parse_args()
+
+    # Первый запуск прогревает кеш байткода и не учитывается
+    measure(args.module)
+    runs = [measure(args.module) for _ in range(args.runs)]
+    median = statistics.median(total for total, _ in runs)
+    _, modules = runs[-1]
+
+    print(f"📦 import {args.module}: медиана {median:.1f} мс "
+          f"(мин {min(t for t, _ in runs):.1f}, макс {max(t for t, _ in runs):.1f}, запусков {args.runs})")
+    print(f"\n🐢 Самые тяжелые модули (суммарно):")
+    heaviest = sorted(modules.items(), key=lambda item: item[1], reverse=True)
+    for name, ms in heaviest[1:args.top + 1]:
+        print(f"   {ms:8.1f} мс  {name}")
+
+    failed = False
+
+    eager = sorted({
+        name.split(".")[0] for name in modules
+        if name.split(".")[0] in LAZY_MODULES
+    })
+    if eager:
+        print(f"\n❌ Загружены модули, которые должны импортироваться лениво: {', '.join(eager)}")
+        failed = True
+
+    if median > args.budget_ms:
+        print(f"\n❌ Бюджет превышен: {median:.1f} мс > {args.budget_ms:.1f} мс")
+        failed = True
+    else:
+        print(f"\n✅ В пределах бюджета: {median:.1f} мс ≤ {args.budget_ms:.1f} мс")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,21 +7,17 @@
 # ═════════════════════════════════════════════════════════════════
 
 import os
-from typing import Dict
+import sys
+import signal
 
-from telegram import Update
-from telegram.ext import (
-    Application, CommandHandler, MessageHandler, CallbackQueryHandler,
-    ContextTypes, filters
-)
-from dotenv import load_dotenv
-
-from models import AnalysisMode
+from backends import load_env
 from identifier import IdentifierAgent
-from handlers import BotHandlers
+from user_store import UserStore
+from history import HistoryLog
 
-# Загружаем переменные окружения
-load_dotenv()
+# telegram.ext, dotenv, handlers и profiler (тянет asyncio) импортируются
+# лениво: worker и batch процессы, которым нужен только IdentifierAgent,
+# не платят за их загрузку. .env загружается при создании IdentifierAgent
 
 
 class PlantRecognitionBot:
@@ -31,6 +27,8 @@ class PlantRecognitionBot:
     
     def __init__(self):
         """Инициализирует бот"""
+        load_env()
+        
         # Проверяем Telegram токен
         self.tg_token = os.getenv("TELEGRAM_BOT_TOKEN")
         if not self.tg_token or self.tg_token == "your_telegram_bot_token_here":
@@ -47,35 +45,99 @@ class PlantRecognitionBot:
             raise
         
         # Данные пользователей
-        self.user_data: Dict[int, dict] = {}
+        self.user_data = UserStore.from_env()
+        
+        # История определений
+        self.history = HistoryLog.from_env()
         
-        # Инициализируем обработчики
-        self.handlers = BotHandlers(self.identifier, self.user_data)
+        # Администраторы (через запятую в ADMIN_IDS)
+        self.admin_ids = {
+            int(uid) for uid in os.getenv("ADMIN_IDS", "").split(",") if uid.strip()
+        }
         
-        # Создаём приложение
-        self.app = Application.builder().token(self.tg_token).build()
-        self._setup_handlers()
+        # Профайлер: /profile для администраторов или сигнал SIGUSR1
+        from profiler import SamplingProfiler
+        self.profiler = SamplingProfiler.from_env()
+        
+        # Приложение и обработчики создаются при первом обращении к self.app
+        self._app = None
+        self.handlers = None
+        self._health_task = None
+    
+    @property
+    def app(self):
+        """Приложение telegram.ext с зарегистрированными обработчиками"""
+        if self._app is None:
+            from telegram.ext import Application
+            from handlers import BotHandlers
+            
+            self.handlers = BotHandlers(
+                self.identifier, self.user_data, self.history, self.admin_ids, self.profiler
+            )
+            self._app = Application.builder().token(self.tg_token).post_init(self._post_init).build()
+            self._setup_handlers()
+        return self._app
+    
+    def _check_backends(self):
+        """Проверяет все бэкенды пула (в фоне после запуска, см. _post_init)"""
+        results = self.identifier.health_check()
+        for name, ok, info in results:
+            print(f"   {'✅' if ok else '❌'} {name}: {info}")
+        
+        if not any(ok for _, ok, _ in results):
+            print("⚠️  Ни один бэкенд не ответил, запросы будут повторяться после cooldown")
+    
+    async def _post_init(self, app):
+        """Вызывается внутри запущенного event loop"""
+        import asyncio
+        
+        loop = asyncio.get_running_loop()
+        
+        # Проверка бэкендов не задерживает старт: клиенты создаются и
+        # опрашиваются параллельно в фоне, пока бот уже принимает сообщения
+        self._health_task = loop.run_in_executor(None, self._check_backends)
+        
+        try:
+            loop.add_signal_handler(signal.SIGUSR1, self._toggle_profiler, loop)
+        except (AttributeError, NotImplementedError):
+            # Windows: сигнала SIGUSR1 нет, остается команда /profile
+            pass
+    
+    def _toggle_profiler(self, loop):
+        """SIGUSR1: запускает профилирование или завершает текущее"""
+        if self.profiler.is_running:
+            self.profiler.stop()
+            return
+        
+        duration = float(os.getenv("PROFILE_DURATION", 30))
+        self.profiler.start(duration, loop=loop)
     
     def _setup_handlers(self):
         """Настраивает обработчики команд и сообщений"""
+        from telegram.ext import CommandHandler, MessageHandler, CallbackQueryHandler, filters
         
         # Команды
-        self.app.add_handler(CommandHandler("start", self.handlers.start_handler))
-        self.app.add_handler(CommandHandler("help", self.handlers.help_handler))
-        self.app.add_handler(CommandHandler("mode", self.handlers.mode_handler))
-        self.app.add_handler(CommandHandler("stats", self.handlers.stats_handler))
+        self._app.add_handler(CommandHandler("start", self.handlers.start_handler))
+        self._app.add_handler(CommandHandler("help", self.handlers.help_handler))
+        self._app.add_handler(CommandHandler("mode", self.handlers.mode_handler))
+        self._app.add_handler(CommandHandler("stats", self.handlers.stats_handler))
+        self._app.add_handler(CommandHandler("history", self.handlers.history_handler))
+        self._app.add_handler(CommandHandler("globalstats", self.handlers.globalstats_handler))
+        self._app.add_handler(CommandHandler("profile", self.handlers.profile_handler))
         
         # Callback обработчики для кнопок
-        self.app.add_handler(CallbackQueryHandler(self.handlers.callback_mode_free, pattern="^mode_free$"))
-        self.app.add_handler(CallbackQueryHandler(self.handlers.callback_mode_paid, pattern="^mode_paid$"))
-        self.app.add_handler(CallbackQueryHandler(self.handlers.callback_set_mode_free, pattern="^set_mode_free$"))
-        self.app.add_handler(CallbackQueryHandler(self.handlers.callback_set_mode_paid, pattern="^set_mode_paid$"))
+        self._app.add_handler(CallbackQueryHandler(self.handlers.callback_mode_free, pattern="^mode_free$"))
+        self._app.add_handler(CallbackQueryHandler(self.handlers.callback_mode_paid, pattern="^mode_paid$"))
+        self._app.add_handler(CallbackQueryHandler(self.handlers.callback_set_mode_free, pattern="^set_mode_free$"))
+        self._app.add_handler(CallbackQueryHandler(self.handlers.callback_set_mode_paid, pattern="^set_mode_paid$"))
+        self._app.add_handler(CallbackQueryHandler(self.handlers.callback_set_mode_multi, pattern="^set_mode_multi$"))
+        self._app.add_handler(CallbackQueryHandler(self.handlers.callback_history_page, pattern=r"^history_\d+$"))
         
         # Обработка фото
-        self.app.add_handler(MessageHandler(filters.PHOTO, self.handlers.photo_handler))
+        self._app.add_handler(MessageHandler(filters.PHOTO, self.handlers.photo_handler))
         
         # Обработка других сообщений
-        self.app.add_handler(MessageHandler(
+        self._app.add_handler(MessageHandler(
             filters.TEXT & ~filters.COMMAND,
             self.handlers.text_handler
         ))
@@ -97,11 +159,82 @@ class PlantRecognitionBot:
         self.app.run_polling()
 
 
+# ═════════════════════════════════════════════════════════════════
+# 🩺 САМОПРОВЕРКА
+# ═════════════════════════════════════════════════════════════════
+
+def self_check() -> bool:
+    """
+    Проверяет конфигурацию, зависимости и бэкенды без запуска бота
+    
+    Returns:
+        True если все проверки прошли
+    """
+    results = []
+    
+    def check(name, func):
+        try:
+            info = func()
+            ok = info is not False
+        except Exception as e:
+            ok, info = False, str(e)[:200]
+        results.append(ok)
+        print(f"   {'✅' if ok else '❌'} {name}" + (f": {info}" if isinstance(info, str) else ""))
+        return ok
+    
+    def check_token():
+        token = os.getenv("TELEGRAM_BOT_TOKEN")
+        if not token or token == "your_telegram_bot_token_here":
+            raise ValueError("TELEGRAM_BOT_TOKEN не установлен")
+    
+    def check_import(module):
+        def run():
+            __import__(module)
+        return run
+    
+    def check_backends():
+        identifier = IdentifierAgent()
+        failed = 0
+        for name, ok, info in identifier.health_check():
+            print(f"      {'✅' if ok else '❌'} {name}: {info}")
+            failed += not ok
+        if failed == len(identifier.pool.backends):
+            raise RuntimeError("ни один бэкенд не ответил")
+        return f"доступно {len(identifier.pool.backends) - failed} из {len(identifier.pool.backends)}"
+    
+    def check_storage():
+        # Только чтение: бот может работать с этими файлами прямо сейчас
+        UserStore.check_from_env()
+        return HistoryLog.check_from_env()
+    
+    print("\n🩺 САМОПРОВЕРКА")
+    load_env()
+    check("python-dotenv (.env)", check_import("dotenv"))
+    check("TELEGRAM_BOT_TOKEN", check_token)
+    check("python-telegram-bot", check_import("telegram.ext"))
+    check("openai", check_import("openai"))
+    check("Хранилища (состояние, история)", check_storage)
+    check("Бэкенды", check_backends)
+    
+    ok = all(results)
+    print(f"\n{'✅ Все проверки пройдены' if ok else '❌ Есть ошибки'}\n")
+    return ok
+
+
 # ═════════════════════════════════════════════════════════════════
 # 🚀 ЗАПУСК БОТА
 # ═════════════════════════════════════════════════════════════════
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Telegram бот для распознавания растений и грибов")
+    parser.add_argument("--check", action="store_true", help="проверить конфигурацию и бэкенды и выйти")
+    args = parser.parse_args()
+    
+    if args.check:
+        sys.exit(0 if self_check() else 1)
+    
     try:
         print("\n" + "="*70)
         print("🔧 ИНИЦИАЛИЗАЦИЯ БОТА")
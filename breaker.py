@@ -0,0 +1,197 @@
+# ═════════════════════════════════════════════════════════════════
+# 🌿 PLANT RECOGNITION BOT - CIRCUIT BREAKER
+# ═════════════════════════════════════════════════════════════════
+# Автомат защиты вызовов модели от каскадных таймаутов
+# ═════════════════════════════════════════════════════════════════
+
+import os
+import time
+import threading
+from collections import deque
+from enum import Enum
+from typing import Dict, Optional, Tuple
+
+
+class BreakerState(Enum):
+    """Состояния автомата"""
+    CLOSED = "closed"          # Запросы идут как обычно
+    OPEN = "open"              # Запросы отклоняются сразу
+    HALF_OPEN = "half_open"    # Пробные запросы после паузы
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker с порогом по доле ошибок
+
+    В состоянии CLOSED считается доля ошибок в скользящем окне последних
+    вызовов. Если она превышает порог - автомат размыкается (OPEN) и
+    отклоняет вызовы open_timeout секунд. Затем пропускает несколько
+    пробных вызовов (HALF_OPEN): успех замыкает автомат, ошибка снова
+    размыкает.
+
+    Переходы между состояниями экспортируются как метрики в формате
+    Prometheus (файл для textfile collector, если задан metrics_path):
+    файл переписывается при каждом переходе, а счетчик отклоненных
+    вызовов - не чаще раза в metrics_interval секунд.
+    """
+
+    def __init__(
+        self,
+        name: str = "model",
+        failure_rate_threshold: float = 0.5,
+        window_size: int = 20,
+        min_calls: int = 5,
+        open_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        metrics_path: Optional[str] = None,
+        metrics_interval: float = 5.0
+    ):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.min_calls = min_calls
+        self.open_timeout = open_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.metrics_path = metrics_path
+        self.metrics_interval = metrics_interval
+        self._exported_at = 0.0
+
+        self._lock = threading.Lock()
+        self._window = deque(maxlen=window_size)
+        self._state = BreakerState.CLOSED
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+        self.transitions: Dict[Tuple[str, str], int] = {}
+        self.rejected_calls = 0
+
+    @classmethod
+    def from_env(cls, name: str = "model") -> "CircuitBreaker":
+        """Создает автомат с параметрами из переменных окружения"""
+        return cls(
+            name=name,
+            failure_rate_threshold=float(os.getenv("BREAKER_FAILURE_RATE", 0.5)),
+            window_size=int(os.getenv("BREAKER_WINDOW", 20)),
+            min_calls=int(os.getenv("BREAKER_MIN_CALLS", 5)),
+            open_timeout=float(os.getenv("BREAKER_OPEN_TIMEOUT", 30)),
+            metrics_path=os.getenv("METRICS_FILE"),
+            metrics_interval=float(os.getenv("METRICS_INTERVAL", 5))
+        )
+
+    @property
+    def state(self) -> BreakerState:
+        with self._lock:
+            return self._state
+
+    # ═════════════════════════════════════════════════════════════════
+    # 🔌 СОСТОЯНИЯ
+    # ═════════════════════════════════════════════════════════════════
+
+    def allow_request(self) -> bool:
+        """Можно ли выполнять вызов прямо сейчас"""
+        with self._lock:
+            if self._state == BreakerState.OPEN:
+                if time.monotonic() - self._opened_at < self.open_timeout:
+                    self._reject()
+                    return False
+                self._transition(BreakerState.HALF_OPEN)
+
+            if self._state == BreakerState.HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    self._reject()
+                    return False
+                self._half_open_calls += 1
+
+            return True
+
+    def _reject(self):
+        """Учитывает отклоненный вызов (вызывать под блокировкой)"""
+        self.rejected_calls += 1
+        if time.monotonic() - self._exported_at >= self.metrics_interval:
+            self._export_metrics()
+
+    def record_success(self):
+        """Регистрирует успешный вызов"""
+        with self._lock:
+            if self._state == BreakerState.HALF_OPEN:
+                self._transition(BreakerState.CLOSED)
+                return
+            self._window.append(True)
+
+    def record_failure(self):
+        """Регистрирует неудачный вызов"""
+        with self._lock:
+            if self._state == BreakerState.HALF_OPEN:
+                self._transition(BreakerState.OPEN)
+                return
+
+            self._window.append(False)
+            if len(self._window) < self.min_calls:
+                return
+
+            failures = sum(1 for ok in self._window if not ok)
+            if failures / len(self._window) >= self.failure_rate_threshold:
+                self._transition(BreakerState.OPEN)
+
+    def _transition(self, new_state: BreakerState):
+        """Переводит автомат в новое состояние (вызывать под блокировкой)"""
+        old_state = self._state
+        self._state = new_state
+        self._half_open_calls = 0
+
+        if new_state == BreakerState.OPEN:
+            self._opened_at = time.monotonic()
+        if new_state == BreakerState.CLOSED:
+            self._window.clear()
+
+        key = (old_state.value, new_state.value)
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        print(f"🔌 Circuit breaker {self.name}: {old_state.value} → {new_state.value}")
+        self._export_metrics()
+
+    # ═════════════════════════════════════════════════════════════════
+    # 📈 МЕТРИКИ
+    # ═════════════════════════════════════════════════════════════════
+
+    def _metrics_text(self) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        lines = [
+            "# HELP circuit_breaker_state Current breaker state (1 for the active state)",
+            "# TYPE circuit_breaker_state gauge",
+        ]
+        for state in BreakerState:
+            value = 1 if state == self._state else 0
+            lines.append(f'circuit_breaker_state{{breaker="{self.name}",state="{state.value}"}} {value}')
+
+        lines += [
+            "# HELP circuit_breaker_transitions_total Breaker state transitions",
+            "# TYPE circuit_breaker_transitions_total counter",
+        ]
+        for (old, new), count in sorted(self.transitions.items()):
+            lines.append(
+                f'circuit_breaker_transitions_total{{breaker="{self.name}",from="{old}",to="{new}"}} {count}'
+            )
+
+        lines += [
+            "# HELP circuit_breaker_rejected_total Calls rejected while open",
+            "# TYPE circuit_breaker_rejected_total counter",
+            f'circuit_breaker_rejected_total{{breaker="{self.name}"}} {self.rejected_calls}',
+        ]
+        return "\n".join(lines) + "\n"
+
+    def metrics_text(self) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        with self._lock:
+            return self._metrics_text()
+
+    def _export_metrics(self):
+        """Атомарно записывает метрики в файл (вызывать под блокировкой)"""
+        if not self.metrics_path:
+            return
+        self._exported_at = time.monotonic()
+        try:
+            tmp_path = f"{self.metrics_path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(self._metrics_text())
+            os.replace(tmp_path, self.metrics_path)
+        except OSError as e:
+            print(f"⚠️  Не удалось записать метрики: {e}")
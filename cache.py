@@ -0,0 +1,100 @@
+# ═════════════════════════════════════════════════════════════════
+# 🌿 PLANT RECOGNITION BOT - RESULT CACHE
+# ═════════════════════════════════════════════════════════════════
+# Кеш результатов для ответов при недоступности модели
+# ═════════════════════════════════════════════════════════════════
+
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from models import AnalysisResult
+
+
+@dataclass(frozen=True)
+class ImageFingerprint:
+    """Отпечаток изображения: точный хеш и перцептивный хеш (если доступен PIL)"""
+    digest: str
+    phash: Optional[int] = None
+
+
+def image_fingerprint(data: bytes) -> ImageFingerprint:
+    """
+    Считает отпечаток изображения
+
+    Перцептивный average hash 8x8 считается только если установлен Pillow,
+    иначе похожие изображения не находятся - только точные совпадения.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    return ImageFingerprint(digest=digest, phash=_average_hash(data))
+
+
+def _average_hash(data: bytes, size: int = 8) -> Optional[int]:
+    """Average hash: 64 бита, каждый - пиксель ярче среднего"""
+    try:
+        from io import BytesIO
+        from PIL import Image
+    except ImportError:
+        return None
+
+    try:
+        with Image.open(BytesIO(data)) as img:
+            # Для JPEG декодируем сразу в уменьшенном масштабе
+            img.draft("L", (size * 8, size * 8))
+            pixels = list(img.convert("L").resize((size, size)).getdata())
+    except Exception:
+        return None
+
+    mean = sum(pixels) / len(pixels)
+    value = 0
+    for pixel in pixels:
+        value = (value << 1) | (1 if pixel > mean else 0)
+    return value
+
+
+class ResultCache:
+    """
+    LRU кеш успешных результатов анализа
+
+    Поиск сначала по точному хешу, затем по ближайшему перцептивному
+    хешу в пределах max_distance бит.
+    """
+
+    def __init__(self, max_size: int = 2000, max_distance: int = 6):
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def put(self, fingerprint: ImageFingerprint, result: AnalysisResult):
+        """Сохраняет результат"""
+        with self._lock:
+            self._items[fingerprint.digest] = (fingerprint.phash, result)
+            self._items.move_to_end(fingerprint.digest)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def get(self, fingerprint: ImageFingerprint) -> Optional[AnalysisResult]:
+        """Ищет результат для того же или похожего изображения"""
+        with self._lock:
+            item = self._items.get(fingerprint.digest)
+            if item is not None:
+                self._items.move_to_end(fingerprint.digest)
+                return item[1]
+
+            if fingerprint.phash is None:
+                return None
+
+            best, best_distance = None, self.max_distance + 1
+            for phash, result in self._items.values():
+                if phash is None:
+                    continue
+                distance = bin(phash ^ fingerprint.phash).count("1")
+                if distance < best_distance:
+                    best, best_distance = result, distance
+            return best
+
+    def __len__(self) -> int:
+        return len(self._items)
@@ -0,0 +1,169 @@
+# ═════════════════════════════════════════════════════════════════
+# 🌿 PLANT RECOGNITION BOT - MESSAGE DISPATCHER
+# ═════════════════════════════════════════════════════════════════
+# Исходящие сообщения с учетом flood-лимитов Telegram
+# ═════════════════════════════════════════════════════════════════
+
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import Dict
+
+from telegram import Message
+from telegram.constants import ChatAction
+from telegram.error import RetryAfter
+
+
+class RateLimiter:
+    """
+    Выравнивает вызовы по минимальному интервалу
+
+    Каждый вызов acquire() занимает следующий свободный слот и ждет его.
+    Работает внутри одного event loop, поэтому блокировка не нужна.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._next_slot = 0.0
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def is_busy(self) -> bool:
+        """Есть ли вызовы, ожидающие своего слота"""
+        # Последний занятый слот = _next_slot - interval; если он в будущем, его ждут
+        return self._next_slot - self.interval > asyncio.get_running_loop().time()
+
+    def delay(self, seconds: float):
+        """Сдвигает следующий слот (например после RetryAfter)"""
+        now = asyncio.get_running_loop().time()
+        self._next_slot = max(self._next_slot, now + seconds)
+
+
+class MessageDispatcher:
+    """
+    Диспетчер исходящих сообщений
+
+    - глобальный и per-chat лимит частоты (в группах строже:
+      Telegram разрешает около 20 сообщений в минуту на группу)
+    - автоматическая обработка RetryAfter
+    - периодическое обновление статуса "печатает..."
+    - редактирование сообщения-заглушки вместо отправки нового
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 25.0,
+        chat_interval: float = 1.0,
+        group_interval: float = 3.0,
+        max_retries: int = 3,
+        typing_interval: float = 4.5,
+        max_tracked_chats: int = 10000
+    ):
+        self.global_limiter = RateLimiter(1.0 / global_rate)
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.max_retries = max_retries
+        self.typing_interval = typing_interval
+        self.max_tracked_chats = max_tracked_chats
+        self._chat_limiters: Dict[int, RateLimiter] = {}
+
+    def _chat_limiter(self, chat_id: int) -> RateLimiter:
+        """Возвращает лимитер чата, удаляя давно неактивные"""
+        limiter = self._chat_limiters.get(chat_id)
+        if limiter is None:
+            if len(self._chat_limiters) >= self.max_tracked_chats:
+                now = asyncio.get_running_loop().time()
+                self._chat_limiters = {
+                    cid: lim for cid, lim in self._chat_limiters.items()
+                    if lim._next_slot > now
+                }
+            # У групп и каналов отрицательный chat_id
+            interval = self.group_interval if chat_id < 0 else self.chat_interval
+            limiter = RateLimiter(interval)
+            self._chat_limiters[chat_id] = limiter
+        return limiter
+
+    @staticmethod
+    def _retry_seconds(error: RetryAfter) -> float:
+        """retry_after бывает int или timedelta в зависимости от версии PTB"""
+        retry_after = error.retry_after
+        if isinstance(retry_after, timedelta):
+            return retry_after.total_seconds()
+        return float(retry_after)
+
+    async def _call(self, chat_id: int, func, *args, retries: int = None, limited: bool = True, **kwargs):
+        """
+        Выполняет запрос к Telegram с учетом лимитов и RetryAfter
+
+        При limited=False запрос не занимает слоты лимитеров (chat actions),
+        но RetryAfter все равно сдвигает их.
+        """
+        retries = self.max_retries if retries is None else retries
+        chat_limiter = self._chat_limiter(chat_id)
+
+        for attempt in range(retries + 1):
+            if limited:
+                await chat_limiter.acquire()
+                await self.global_limiter.acquire()
+            try:
+                return await func(*args, **kwargs)
+            except RetryAfter as e:
+                wait = self._retry_seconds(e)
+                # Flood wait может быть общим для бота: притормаживаем и остальные чаты
+                chat_limiter.delay(wait)
+                self.global_limiter.delay(wait)
+                if attempt >= retries:
+                    raise
+                print(f"⏳ Flood-лимит Telegram, повтор через {wait:.0f} сек")
+
+    # ═════════════════════════════════════════════════════════════════
+    # 📤 ОТПРАВКА
+    # ═════════════════════════════════════════════════════════════════
+
+    async def reply(self, message: Message, text: str, **kwargs) -> Message:
+        """Отвечает на сообщение"""
+        return await self._call(message.chat_id, message.reply_text, text, **kwargs)
+
+    async def edit(self, message: Message, text: str, **kwargs):
+        """Редактирует ранее отправленное сообщение"""
+        return await self._call(message.chat_id, message.edit_text, text, **kwargs)
+
+    async def send_action(self, bot, chat_id: int, action: str = ChatAction.TYPING):
+        """
+        Отправляет chat action без повторов
+
+        Статус "печатает..." не критичен: он не занимает слоты лимитеров и
+        пропускается, если в чате или глобально есть ожидающие сообщения,
+        чтобы не задерживать заглушки и результаты. Ошибки только логируются.
+        """
+        if self.global_limiter.is_busy() or self._chat_limiter(chat_id).is_busy():
+            return
+        try:
+            await self._call(chat_id, bot.send_chat_action, chat_id, action, retries=0, limited=False)
+        except Exception as e:
+            print(f"⚠️  Не удалось отправить chat action: {str(e)[:100]}")
+
+    @asynccontextmanager
+    async def typing(self, bot, chat_id: int):
+        """Держит статус "печатает..." пока выполняется блок"""
+
+        async def refresh():
+            while True:
+                await self.send_action(bot, chat_id)
+                await asyncio.sleep(self.typing_interval)
+
+        task = asyncio.create_task(refresh())
+        try:
+            yield
+        finally:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
@@ -5,23 +5,62 @@
 # ═════════════════════════════════════════════════════════════════
 
 import os
+import asyncio
 import tempfile
-from typing import Dict
+from datetime import datetime
+from typing import Optional, Set
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from telegram.constants import ChatAction, ParseMode
+from telegram.constants import ParseMode
 
 from models import AnalysisMode, AnalysisResult
 from identifier import IdentifierAgent
+from dispatcher import MessageDispatcher
+from user_store import UserStore
+from history import HistoryLog
+from profiler import SamplingProfiler
+
+
+# Оформление режимов
+MODE_EMOJI = {
+    AnalysisMode.FREE: "🆓",
+    AnalysisMode.PAID: "💎",
+    AnalysisMode.MULTI: "🔎",
+}
+MODE_NAMES = {
+    AnalysisMode.FREE: "Бесплатный",
+    AnalysisMode.PAID: "Платный",
+    AnalysisMode.MULTI: "Несколько объектов",
+}
+MODE_TIME_EST = {
+    AnalysisMode.FREE: "5-7 сек",
+    AnalysisMode.PAID: "10-15 сек",
+    AnalysisMode.MULTI: "5-10 сек",
+}
+
+# Лимит длины сообщения Telegram с запасом на подпись
+MAX_MESSAGE_LENGTH = 3800
 
 
 class BotHandlers:
     """Обработчики команд и сообщений"""
     
-    def __init__(self, identifier: IdentifierAgent, user_data: Dict[int, dict]):
+    def __init__(
+        self,
+        identifier: IdentifierAgent,
+        user_data: UserStore,
+        history: HistoryLog,
+        admin_ids: Optional[Set[int]] = None,
+        profiler: Optional[SamplingProfiler] = None
+    ):
         self.identifier = identifier
         self.user_data = user_data
+        self.history = history
+        self.admin_ids = admin_ids or set()
+        self.profiler = profiler or SamplingProfiler.from_env()
+        self._profile_task: Optional[asyncio.Task] = None
+        self.dispatcher = MessageDispatcher()
     
     # ═════════════════════════════════════════════════════════════════
     # 🔧 КОМАНДЫ
@@ -32,12 +71,7 @@ class BotHandlers:
         user_id = update.effective_user.id
         
         # Инициализируем данные пользователя
-        if user_id not in self.user_data:
-            self.user_data[user_id] = {
-                "mode": AnalysisMode.PAID,
-                "total_images": 0,
-                "total_tokens_used": 0
-            }
+        self.user_data.ensure(user_id)
         
         keyboard = [
             [
@@ -90,6 +124,7 @@ class BotHandlers:
 1️⃣ *Выберите режим* (/mode)
    🆓 Бесплатный - быстро
    💎 Платный - точнее
+   🔎 Несколько объектов - все виды на фото
 
 2️⃣ *Отправьте фото*
    • Растения или грибы
@@ -119,6 +154,7 @@ class BotHandlers:
 /help - справка
 /mode - переключить режим
 /stats - статистика
+/history - история определений
 """
         
         await update.message.reply_text(
@@ -129,17 +165,20 @@ class BotHandlers:
     async def mode_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /mode"""
         user_id = update.effective_user.id
-        current_mode = self.user_data.get(user_id, {}).get("mode", AnalysisMode.PAID)
+        current_mode = self.user_data.get_mode(user_id)
         
         keyboard = [
             [
                 InlineKeyboardButton("🆓 Бесплатный (5-7 сек)", callback_data="set_mode_free"),
                 InlineKeyboardButton("💎 Платный (10-15 сек)", callback_data="set_mode_paid")
+            ],
+            [
+                InlineKeyboardButton("🔎 Несколько объектов (5-10 сек)", callback_data="set_mode_multi")
             ]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        current = "🆓 БЕСПЛАТНЫЙ" if current_mode == AnalysisMode.FREE else "💎 ПЛАТНЫЙ"
+        current = f"{MODE_EMOJI[current_mode]} {MODE_NAMES[current_mode].upper()}"
         
         message = f"""
 *Выберите режим анализа:*
@@ -156,6 +195,11 @@ class BotHandlers:
    ✓ Высокая точность
    ✓ Больше информации
    ⏱️ Медленнее (~10-15 сек)
+
+🔎 *Несколько объектов*
+   ✓ Находит несколько видов на одном фото
+   ✓ Области анализируются параллельно
+   ✓ Базовая точность для каждого вида
 """
         
         await update.message.reply_text(
@@ -167,14 +211,14 @@ class BotHandlers:
     async def stats_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /stats"""
         user_id = update.effective_user.id
-        user_stats = self.user_data.get(user_id, {})
+        user_stats = self.user_data.get(user_id)
         
-        mode = user_stats.get("mode", AnalysisMode.PAID).value
-        images = user_stats.get("total_images", 0)
-        tokens = user_stats.get("total_tokens_used", 0)
+        mode = user_stats.mode if user_stats else AnalysisMode.PAID
+        images = user_stats.total_images if user_stats else 0
+        tokens = user_stats.total_tokens_used if user_stats else 0
         
-        mode_emoji = "🆓" if mode == "free" else "💎"
-        mode_name = "Бесплатный" if mode == "free" else "Платный"
+        mode_emoji = MODE_EMOJI[mode]
+        mode_name = MODE_NAMES[mode]
         
         message = f"""
 📊 *Ваша статистика*
@@ -191,6 +235,124 @@ class BotHandlers:
             parse_mode=ParseMode.MARKDOWN
         )
     
+    HISTORY_PAGE_SIZE = 5
+    
+    def _history_page(self, user_id: int, page: int):
+        """Формирует текст и клавиатуру страницы истории"""
+        total = self.history.count(user_id)
+        if not total:
+            return "📜 *История пуста*\n\n📸 Отправьте фото растения или гриба!", None
+        
+        pages = (total + self.HISTORY_PAGE_SIZE - 1) // self.HISTORY_PAGE_SIZE
+        page = min(max(page, 0), pages - 1)
+        entries = self.history.page(user_id, page, self.HISTORY_PAGE_SIZE)
+        
+        lines = [f"📜 *История определений* ({page + 1}/{pages})\n"]
+        for entry in entries:
+            date = datetime.fromtimestamp(entry.timestamp).strftime("%d.%m.%Y %H:%M")
+            lines.append(
+                f"🕐 {date}\n"
+                f"*{entry.result.common_name}* (`{entry.scientific_name}`)\n"
+                f"📊 {entry.confidence * 100:.0f}%\n"
+            )
+        
+        buttons = []
+        if page > 0:
+            buttons.append(InlineKeyboardButton("◀️ Новее", callback_data=f"history_{page - 1}"))
+        if page < pages - 1:
+            buttons.append(InlineKeyboardButton("Старее ▶️", callback_data=f"history_{page + 1}"))
+        reply_markup = InlineKeyboardMarkup([buttons]) if buttons else None
+        
+        return "\n".join(lines), reply_markup
+    
+    async def history_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /history"""
+        message, reply_markup = self._history_page(update.effective_user.id, 0)
+        
+        await update.message.reply_text(
+            message,
+            reply_markup=reply_markup,
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    async def globalstats_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Обработчик команды /globalstats (только для администраторов)"""
+        if update.effective_user.id not in self.admin_ids:
+            return
+        
+        stats = self.user_data.global_stats()
+        by_mode = stats["users_by_mode"]
+        
+        message = f"""
+🌍 *Глобальная статистика*
+
+👥 *Пользователей:* {stats["users_total"]}
+   • В памяти: {stats["users_in_memory"]}
+   • Вытеснено на диск: {stats["users_spilled"]}
+
+🆓 *Бесплатный режим:* {by_mode[AnalysisMode.FREE]}
+💎 *Платный режим:* {by_mode[AnalysisMode.PAID]}
+🔎 *Несколько объектов:* {by_mode[AnalysisMode.MULTI]}
+
+📸 *Обработано фото:* {stats["images_total"]}
+🔢 *Использовано токенов:* {stats["tokens_total"]}
+💾 *Память таблицы:* {stats["memory_bytes"] / 1024 / 1024:.1f} МБ
+"""
+        
+        await update.message.reply_text(
+            message,
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    PROFILE_DEFAULT_SECONDS = 30
+    PROFILE_MAX_SECONDS = 300
+    
+    async def profile_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """
+        Обработчик команды /profile (только для администраторов)
+        
+        /profile [секунды] - запустить профилирование
+        /profile stop - завершить досрочно
+        """
+        if update.effective_user.id not in self.admin_ids:
+            return
+        
+        args = context.args or []
+        
+        if args and args[0] == "stop":
+            if not self.profiler.is_running:
+                await update.message.reply_text("ℹ️ Профилирование не запущено")
+                return
+            self.profiler.stop()
+            return
+        
+        try:
+            duration = int(args[0]) if args else self.PROFILE_DEFAULT_SECONDS
+        except ValueError:
+            await update.message.reply_text("Использование: /profile [секунды] или /profile stop")
+            return
+        duration = min(max(duration, 1), self.PROFILE_MAX_SECONDS)
+        
+        try:
+            self.profiler.start(duration, loop=asyncio.get_running_loop())
+        except RuntimeError as e:
+            await update.message.reply_text(f"⚠️ {e}")
+            return
+        
+        await update.message.reply_text(
+            f"🔬 *Профилирование запущено на {duration} сек*\n\n/profile stop - завершить досрочно",
+            parse_mode=ParseMode.MARKDOWN
+        )
+        
+        # Сводку отправим, когда сессия завершится
+        self._profile_task = asyncio.create_task(self._send_profile_report(update.message))
+    
+    async def _send_profile_report(self, message):
+        """Ждет завершения профилирования и отправляет сводку"""
+        report = await asyncio.to_thread(self.profiler.join)
+        if report is not None:
+            await self.dispatcher.reply(message, report.to_message(), parse_mode=ParseMode.MARKDOWN)
+    
     # ═════════════════════════════════════════════════════════════════
     # 🔘 CALLBACK ОБРАБОТЧИКИ
     # ═════════════════════════════════════════════════════════════════
@@ -200,14 +362,7 @@ class BotHandlers:
         query = update.callback_query
         user_id = query.from_user.id
         
-        if user_id not in self.user_data:
-            self.user_data[user_id] = {
-                "mode": AnalysisMode.FREE,
-                "total_images": 0,
-                "total_tokens_used": 0
-            }
-        else:
-            self.user_data[user_id]["mode"] = AnalysisMode.FREE
+        self.user_data.set_mode(user_id, AnalysisMode.FREE)
         
         await query.answer("✅ Выбран бесплатный режим", show_alert=False)
         
@@ -232,14 +387,7 @@ class BotHandlers:
         query = update.callback_query
         user_id = query.from_user.id
         
-        if user_id not in self.user_data:
-            self.user_data[user_id] = {
-                "mode": AnalysisMode.PAID,
-                "total_images": 0,
-                "total_tokens_used": 0
-            }
-        else:
-            self.user_data[user_id]["mode"] = AnalysisMode.PAID
+        self.user_data.set_mode(user_id, AnalysisMode.PAID)
         
         await query.answer("✅ Выбран платный режим", show_alert=False)
         
@@ -259,12 +407,27 @@ class BotHandlers:
             parse_mode=ParseMode.MARKDOWN
         )
     
+    async def callback_history_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Callback для листания истории"""
+        query = update.callback_query
+        page = int(query.data.split("_")[1])
+        
+        await query.answer()
+        
+        message, reply_markup = self._history_page(query.from_user.id, page)
+        
+        await query.edit_message_text(
+            message,
+            reply_markup=reply_markup,
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
     async def callback_set_mode_free(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Callback для переключения на бесплатный режим из /mode"""
         query = update.callback_query
         user_id = query.from_user.id
         
-        self.user_data[user_id]["mode"] = AnalysisMode.FREE
+        self.user_data.set_mode(user_id, AnalysisMode.FREE)
         
         await query.answer("✅ Перешли на бесплатный режим", show_alert=False)
         
@@ -289,7 +452,7 @@ class BotHandlers:
         query = update.callback_query
         user_id = query.from_user.id
         
-        self.user_data[user_id]["mode"] = AnalysisMode.PAID
+        self.user_data.set_mode(user_id, AnalysisMode.PAID)
         
         await query.answer("✅ Перешли на платный режим", show_alert=False)
         
@@ -301,6 +464,31 @@ class BotHandlers:
 • Точность: Высокая
 • Модель: Perplexity (расширенный)
 
+Отправляйте фото! 📸
+"""
+        
+        await query.edit_message_text(
+            message,
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    async def callback_set_mode_multi(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Callback для переключения на режим нескольких объектов из /mode"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        
+        self.user_data.set_mode(user_id, AnalysisMode.MULTI)
+        
+        await query.answer("✅ Перешли на режим нескольких объектов", show_alert=False)
+        
+        message = """
+✅ *Текущий режим: НЕСКОЛЬКО ОБЪЕКТОВ (🔎)*
+
+Параметры анализа:
+• Скорость: ~5-10 сек
+• Фото делится на области, каждая анализируется параллельно
+• Одинаковые виды объединяются
+
 Отправляйте фото! 📸
 """
         
@@ -319,52 +507,57 @@ class BotHandlers:
         chat_id = update.effective_chat.id
         
         # Инициализируем данные пользователя если нужно
-        if user_id not in self.user_data:
-            self.user_data[user_id] = {
-                "mode": AnalysisMode.PAID,
-                "total_images": 0,
-                "total_tokens_used": 0
-            }
-        
-        user_mode = self.user_data[user_id]["mode"]
-        mode_emoji = "🆓" if user_mode == AnalysisMode.FREE else "💎"
-        
-        # Отправляем "печатает..." индикатор
-        await context.bot.send_chat_action(
-            chat_id=chat_id,
-            action=ChatAction.TYPING
-        )
+        user_mode = self.user_data.ensure(user_id).mode
+        mode_emoji = MODE_EMOJI[user_mode]
+        
+        placeholder = None
         
         try:
-            # Отправляем сообщение о начале анализа
-            time_est = "5-7 сек" if user_mode == AnalysisMode.FREE else "10-15 сек"
-            await update.message.reply_text(
+            # Отправляем сообщение о начале анализа (потом заменим результатом)
+            time_est = MODE_TIME_EST[user_mode]
+            placeholder = await self.dispatcher.reply(
+                update.message,
                 f"{mode_emoji} *Анализирую фото...*\n\n⏳ Это займет {time_est}",
                 parse_mode=ParseMode.MARKDOWN
             )
             
-            # Скачиваем и сохраняем изображение
-            photo_file = await update.message.photo[-1].get_file()
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-                image_path = tmp.name
-            
-            await photo_file.download_to_drive(image_path)
-            print(f"📥 Фото сохранено: {image_path}")
-            
-            # Анализируем с выбранным режимом
-            result, tokens_used = self.identifier.identify(image_path, user_mode)
+            # Держим "печатает..." индикатор на время анализа
+            async with self.dispatcher.typing(context.bot, chat_id):
+                # Скачиваем и сохраняем изображение
+                photo_file = await update.message.photo[-1].get_file()
+                
+                with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
+                    image_path = tmp.name
+                
+                await photo_file.download_to_drive(image_path)
+                print(f"📥 Фото сохранено: {image_path}")
+                
+                # Анализируем с выбранным режимом (в потоке, чтобы не блокировать event loop)
+                if user_mode == AnalysisMode.MULTI:
+                    results, tokens_used = await asyncio.to_thread(
+                        self.identifier.identify_multi, image_path
+                    )
+                else:
+                    result, tokens_used = await asyncio.to_thread(
+                        self.identifier.identify, image_path, user_mode
+                    )
+                    results = [result]
             
             # Обновляем статистику
-            self.user_data[user_id]["total_images"] += 1
-            self.user_data[user_id]["total_tokens_used"] += tokens_used
+            self.user_data.add_usage(user_id, images=1, tokens=tokens_used)
+            
+            # Сохраняем в историю (ошибки анализа и ответы из кеша не сохраняем)
+            for result in results:
+                if result.scientific_name != "N/A" and not result.cached:
+                    self.history.append(user_id, result)
             
             # Форматируем ответ
-            response_msg = result.to_message()
-            response_msg += f"\n\n{mode_emoji} *Режим:* {'Бесплатный' if user_mode == AnalysisMode.FREE else 'Платный'}\n• Токенов: {tokens_used}"
+            response_msg = self._format_results(results)
+            response_msg += f"\n\n{mode_emoji} *Режим:* {MODE_NAMES[user_mode]}\n• Токенов: {tokens_used}"
             
-            # Отправляем результат
-            await update.message.reply_text(
+            # Заменяем заглушку результатом
+            await self.dispatcher.edit(
+                placeholder,
                 response_msg,
                 parse_mode=ParseMode.MARKDOWN
             )
@@ -379,10 +572,31 @@ class BotHandlers:
         except Exception as e:
             error_msg = f"❌ *Ошибка анализа:*\n\n`{str(e)[:200]}`"
             print(f"Error: {str(e)}")
-            await update.message.reply_text(
-                error_msg,
-                parse_mode=ParseMode.MARKDOWN
-            )
+            try:
+                if placeholder is not None:
+                    await self.dispatcher.edit(placeholder, error_msg, parse_mode=ParseMode.MARKDOWN)
+                else:
+                    await self.dispatcher.reply(update.message, error_msg, parse_mode=ParseMode.MARKDOWN)
+            except Exception as send_error:
+                print(f"Error: {str(send_error)}")
+    
+    @staticmethod
+    def _format_results(results) -> str:
+        """Форматирует один или несколько результатов в одно сообщение"""
+        if len(results) == 1:
+            return results[0].to_message()
+        
+        message = f"🔎 *Найдено видов: {len(results)}*\n"
+        for i, result in enumerate(results):
+            full = result.to_message()
+            if len(message) + len(full) <= MAX_MESSAGE_LENGTH:
+                message += full
+                continue
+            # Не помещается целиком - остальные виды кратко
+            for rest in results[i:]:
+                message += f"\n• *{rest.common_name}* (`{rest.scientific_name}`) {rest.confidence * 100:.0f}%"
+            break
+        return message
     
     async def text_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик текстовых сообщений"""
@@ -394,6 +608,7 @@ class BotHandlers:
 /help - справка
 /mode - переключить режим
 /stats - статистика
+/history - история определений
 """
         
         await update.message.reply_text(
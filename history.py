@@ -0,0 +1,474 @@
+# ═════════════════════════════════════════════════════════════════
+# 🌿 PLANT RECOGNITION BOT - HISTORY LOG
+# ═════════════════════════════════════════════════════════════════
+# Компактный журнал истории идентификаций на диске
+# ═════════════════════════════════════════════════════════════════
+#
+# Файлы в HISTORY_DIR (N - номер поколения из файла CURRENT):
+#
+#   history.N.idx    - записи фиксированного размера (32 байта):
+#                      user_id, timestamp, id научного названия,
+#                      confidence, смещение полной записи и номер
+#                      предыдущей записи того же пользователя
+#   history.N.dat    - полные AnalysisResult, JSON по строке на запись
+#   history.N.heads  - SQLite: последняя запись и число записей
+#                      каждого пользователя
+#   history.names    - научные названия, по одному на строку (id = номер)
+#
+# Записи пользователя связаны в список от новой к старой, поэтому
+# /history читает только свои записи, а в оперативной памяти нет
+# индекса по пользователям. Уплотнение пишет новое поколение файлов
+# и переключается на него одной атомарной заменой CURRENT.
+# ═════════════════════════════════════════════════════════════════
+
+import os
+import json
+import mmap
+import time
+import struct
+import sqlite3
+import threading
+from dataclasses import asdict
+from typing import Dict, List, Optional, Tuple
+
+from models import AnalysisResult, HistoryEntry
+
+
+INDEX_RECORD = struct.Struct("<qIIfQI")
+
+# Значение prev у первой записи пользователя
+NO_RECORD = 0xFFFFFFFF
+
+
+def _open_heads(path: str) -> sqlite3.Connection:
+    """Открывает (или создает) таблицу последних записей пользователей"""
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS heads ("
+        "user_id INTEGER PRIMARY KEY, head INTEGER, count INTEGER)"
+    )
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+    conn.execute("INSERT OR IGNORE INTO meta VALUES ('indexed', 0), ('dead', 0)")
+    return conn
+
+
+class HistoryLog:
+    """
+    Журнал истории идентификаций
+
+    Для каждого пользователя хранятся последние max_per_user записей.
+    Более старые записи становятся мертвыми и удаляются фоновым
+    уплотнением, когда их становится больше, чем живых.
+    """
+
+    def __init__(
+        self,
+        directory: str = "history",
+        max_per_user: int = 100,
+        min_dead_to_compact: int = 1000
+    ):
+        self.directory = directory
+        self.max_per_user = max_per_user
+        self.min_dead_to_compact = min_dead_to_compact
+
+        os.makedirs(directory, exist_ok=True)
+        self.current_path = os.path.join(directory, "CURRENT")
+        self.names_path = os.path.join(directory, "history.names")
+
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compacting = False
+        self._map: Optional[mmap.mmap] = None
+        self._dat_map: Optional[mmap.mmap] = None
+
+        self._names: List[str] = []
+        self._name_ids: Dict[str, int] = {}
+        self._load_names()
+        self._names_file = open(self.names_path, "a", encoding="utf-8", newline="\n")
+
+        self._generation = self._read_generation()
+        self._remove_stale_generations()
+        self._open_generation()
+
+    @classmethod
+    def from_env(cls) -> "HistoryLog":
+        """Создает журнал с параметрами из переменных окружения"""
+        return cls(
+            directory=os.getenv("HISTORY_DIR", "history"),
+            max_per_user=int(os.getenv("HISTORY_MAX_PER_USER", 100))
+        )
+
+    @classmethod
+    def check_from_env(cls) -> str:
+        """
+        Проверяет журнал, ничего не меняя на диске
+
+        Журналом может пользоваться работающий бот (в том числе идет
+        уплотнение), поэтому файлы только читаются: каталог доступен на
+        запись, а индекс текущего поколения состоит из целых записей.
+        """
+        directory = os.getenv("HISTORY_DIR", "history")
+        if not os.path.exists(directory):
+            parent = os.path.dirname(os.path.abspath(directory))
+            if not os.access(parent, os.W_OK):
+                raise PermissionError(f"нельзя создать каталог {directory}")
+            return f"{directory} будет создан при запуске"
+        if not os.access(directory, os.W_OK):
+            raise PermissionError(f"нет прав на запись в {directory}")
+
+        current_path = os.path.join(directory, "CURRENT")
+        generation = 0
+        if os.path.exists(current_path):
+            with open(current_path) as f:
+                generation = int(f.read().strip() or 0)
+        idx_path = os.path.join(directory, f"history.{generation}.idx")
+        if not os.path.exists(idx_path):
+            return f"{directory}: журнал пуст"
+
+        records = os.path.getsize(idx_path) // INDEX_RECORD.size
+        return f"{directory}: {records} записей (поколение {generation})"
+
+    # ═════════════════════════════════════════════════════════════════
+    # 📂 ФАЙЛЫ
+    # ═════════════════════════════════════════════════════════════════
+
+    def _paths(self, generation: int) -> Tuple[str, str, str]:
+        """Пути (idx, dat, heads) поколения"""
+        base = os.path.join(self.directory, f"history.{generation}")
+        return f"{base}.idx", f"{base}.dat", f"{base}.heads"
+
+    def _read_generation(self) -> int:
+        if not os.path.exists(self.current_path):
+            return 0
+        with open(self.current_path) as f:
+            return int(f.read().strip() or 0)
+
+    def _write_generation(self, generation: int):
+        """Атомарно переключает журнал на поколение generation"""
+        tmp_path = self.current_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(f"{generation}\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.current_path)
+
+    def _remove_stale_generations(self):
+        """Удаляет файлы других поколений (остатки прерванного уплотнения)"""
+        for name in os.listdir(self.directory):
+            parts = name.split(".")
+            if (len(parts) >= 3 and parts[0] == "history" and parts[1].isdigit()
+                    and int(parts[1]) != self._generation):
+                os.remove(os.path.join(self.directory, name))
+
+    def _load_names(self):
+        """Загружает таблицу научных названий"""
+        if not os.path.exists(self.names_path):
+            return
+        # newline="\n": \r и другие разделители не должны делить строки
+        with open(self.names_path, encoding="utf-8", newline="\n") as f:
+            for line in f:
+                name = line.rstrip("\n")
+                self._name_ids.setdefault(name, len(self._names))
+                self._names.append(name)
+
+    def _open_generation(self):
+        """Открывает файлы текущего поколения и догоняет таблицу последних записей"""
+        self.idx_path, self.dat_path, self.heads_path = self._paths(self._generation)
+
+        self._idx_file = open(self.idx_path, "ab")
+        self._dat_file = open(self.dat_path, "ab")
+        self._count = self._idx_file.tell() // INDEX_RECORD.size
+        if self._idx_file.tell() % INDEX_RECORD.size:
+            # Оборванная при сбое запись
+            self._idx_file.truncate(self._count * INDEX_RECORD.size)
+        self._dat_size = self._dat_file.tell()
+
+        self._heads = _open_heads(self.heads_path)
+        indexed = self._meta("indexed")
+        if indexed > self._count:
+            # Таблица опередила индекс (индекс потерял хвост) - строим заново
+            self._heads.execute("DELETE FROM heads")
+            self._set_meta(indexed=0, dead=0)
+            indexed = 0
+        if indexed < self._count:
+            self._replay(indexed)
+        self._dead = self._meta("dead")
+
+    def _close_files(self):
+        self._close_maps()
+        self._idx_file.close()
+        self._dat_file.close()
+        self._heads.close()
+
+    def _close_maps(self):
+        for m in (self._map, self._dat_map):
+            if m is not None:
+                m.close()
+        self._map = None
+        self._dat_map = None
+
+    def _index_map(self) -> mmap.mmap:
+        """mmap индекса, переотображается если файл вырос"""
+        size = self._count * INDEX_RECORD.size
+        if self._map is None or len(self._map) < size:
+            if self._map is not None:
+                self._map.close()
+            with open(self.idx_path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        return self._map
+
+    def _data_map(self) -> mmap.mmap:
+        """mmap полных записей, переотображается если файл вырос"""
+        if self._dat_map is None or len(self._dat_map) < self._dat_size:
+            if self._dat_map is not None:
+                self._dat_map.close()
+            with open(self.dat_path, "rb") as f:
+                self._dat_map = mmap.mmap(f.fileno(), self._dat_size, access=mmap.ACCESS_READ)
+        return self._dat_map
+
+    # ═════════════════════════════════════════════════════════════════
+    # 🔗 ПОСЛЕДНИЕ ЗАПИСИ ПОЛЬЗОВАТЕЛЕЙ
+    # ═════════════════════════════════════════════════════════════════
+
+    def _meta(self, key: str, conn: Optional[sqlite3.Connection] = None) -> int:
+        conn = conn or self._heads
+        return conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()[0]
+
+    def _set_meta(self, conn: Optional[sqlite3.Connection] = None, **values):
+        conn = conn or self._heads
+        conn.executemany("UPDATE meta SET value = ? WHERE key = ?", [(v, k) for k, v in values.items()])
+
+    def _head(self, user_id: int, conn: Optional[sqlite3.Connection] = None) -> Tuple[int, int]:
+        """(последняя запись, число живых записей) пользователя"""
+        conn = conn or self._heads
+        row = conn.execute("SELECT head, count FROM heads WHERE user_id = ?", (user_id,)).fetchone()
+        return row if row is not None else (NO_RECORD, 0)
+
+    def _link(self, user_id: int, rec: int, conn: Optional[sqlite3.Connection] = None) -> int:
+        """
+        Делает rec последней записью пользователя
+
+        Returns:
+            1 если самая старая запись вышла за лимит и стала мертвой, иначе 0
+        """
+        conn = conn or self._heads
+        _, count = self._head(user_id, conn)
+        conn.execute(
+            "INSERT OR REPLACE INTO heads VALUES (?, ?, ?)",
+            (user_id, rec, min(count + 1, self.max_per_user))
+        )
+        return 1 if count >= self.max_per_user else 0
+
+    def _replay(self, start: int):
+        """Добавляет в таблицу записи индекса, дописанные после последнего коммита"""
+        index_map = self._index_map()
+        dead = self._meta("dead")
+        self._heads.execute("BEGIN")
+        for rec in range(start, self._count):
+            user_id = INDEX_RECORD.unpack_from(index_map, rec * INDEX_RECORD.size)[0]
+            dead += self._link(user_id, rec)
+        self._set_meta(indexed=self._count, dead=dead)
+        self._heads.execute("COMMIT")
+
+    def _name_id(self, name: str) -> int:
+        """id научного названия, добавляет новое в таблицу"""
+        # Название от модели может содержать любые разделители строк
+        name = " ".join(name.splitlines())
+        name_id = self._name_ids.get(name)
+        if name_id is None:
+            name_id = len(self._names)
+            self._names.append(name)
+            self._name_ids[name] = name_id
+            self._names_file.write(name + "\n")
+            self._names_file.flush()
+        return name_id
+
+    # ═════════════════════════════════════════════════════════════════
+    # ✏️ ЗАПИСЬ И ЧТЕНИЕ
+    # ═════════════════════════════════════════════════════════════════
+
+    def append(self, user_id: int, result: AnalysisResult, timestamp: Optional[int] = None):
+        """Добавляет результат в журнал"""
+        # json.dumps экранирует переводы строк, поэтому запись занимает одну строку
+        payload = json.dumps(asdict(result), ensure_ascii=False).encode("utf-8") + b"\n"
+        timestamp = int(time.time()) if timestamp is None else timestamp
+
+        with self._lock:
+            name_id = self._name_id(result.scientific_name)
+            head, _ = self._head(user_id)
+            self._dat_file.write(payload)
+            self._dat_file.flush()
+            self._idx_file.write(INDEX_RECORD.pack(
+                user_id, timestamp, name_id, result.confidence, self._dat_size, head
+            ))
+            self._idx_file.flush()
+
+            rec = self._count
+            self._dat_size += len(payload)
+            self._count += 1
+
+            self._heads.execute("BEGIN")
+            self._dead += self._link(user_id, rec)
+            self._set_meta(indexed=self._count, dead=self._dead)
+            self._heads.execute("COMMIT")
+
+            if self._should_compact():
+                self._compacting = True
+                threading.Thread(target=self._compact_in_background, daemon=True).start()
+
+    def count(self, user_id: int) -> int:
+        """Количество записей пользователя"""
+        with self._lock:
+            return self._head(user_id)[1]
+
+    def page(self, user_id: int, page: int, page_size: int = 5) -> List[HistoryEntry]:
+        """Страница истории пользователя, новые записи первыми"""
+        with self._lock:
+            rec, count = self._head(user_id)
+            start = page * page_size
+            end = min(start + page_size, count)
+            if start >= end:
+                return []
+
+            index_map = self._index_map()
+            data_map = self._data_map()
+            entries = []
+            for position in range(end):
+                _, timestamp, name_id, confidence, offset, prev = INDEX_RECORD.unpack_from(
+                    index_map, rec * INDEX_RECORD.size
+                )
+                if position >= start:
+                    line_end = data_map.find(b"\n", offset)
+                    data = json.loads(data_map[offset:line_end].decode("utf-8"))
+                    entries.append(HistoryEntry(
+                        timestamp=timestamp,
+                        scientific_name=self._names[name_id],
+                        confidence=confidence,
+                        result=AnalysisResult(**data)
+                    ))
+                rec = prev
+            return entries
+
+    # ═════════════════════════════════════════════════════════════════
+    # 🧹 УПЛОТНЕНИЕ
+    # ═════════════════════════════════════════════════════════════════
+
+    def _should_compact(self) -> bool:
+        """Мертвых записей больше, чем живых (вызывать под блокировкой)"""
+        return (not self._compacting
+                and self._dead >= self.min_dead_to_compact
+                and self._dead > self._count - self._dead)
+
+    def _compact_in_background(self):
+        try:
+            self.compact()
+        except Exception as e:
+            print(f"❌ Ошибка уплотнения истории: {e}")
+        finally:
+            with self._lock:
+                self._compacting = False
+
+    def compact(self):
+        """
+        Переписывает журнал в новое поколение, оставляя только живые записи
+
+        Основная копия делается без блокировки по снимку таблицы последних
+        записей (WAL-транзакция чтения), под блокировкой докопируются
+        записи, добавленные за это время, и CURRENT атомарно переключается
+        на новое поколение. При сбое до переключения остается старое
+        поколение целиком, а недописанное новое удаляется при старте.
+        """
+        with self._compact_lock:
+            self._compact()
+
+    def _compact(self):
+        with self._lock:
+            snapshot = self._count
+            if not snapshot:
+                return
+            generation = self._generation + 1
+            # Собственные mmap: self._index_map() может переотобразиться при чтении
+            with open(self.idx_path, "rb") as f:
+                src_idx = mmap.mmap(f.fileno(), snapshot * INDEX_RECORD.size, access=mmap.ACCESS_READ)
+            with open(self.dat_path, "rb") as f:
+                src_dat = mmap.mmap(f.fileno(), self._dat_size, access=mmap.ACCESS_READ)
+            reader = sqlite3.connect(self.heads_path, isolation_level=None, check_same_thread=False)
+            reader.execute("BEGIN")
+            users = reader.execute("SELECT user_id, head, count FROM heads")
+            first = users.fetchone()
+
+        idx_path, dat_path, heads_path = self._paths(generation)
+        self._remove_stale_generations()
+        heads = _open_heads(heads_path)
+        idx_dst = open(idx_path, "wb")
+        dat_dst = open(dat_path, "wb")
+        written = 0
+
+        def copy(rec: int, prev: int) -> int:
+            nonlocal written
+            fields = list(INDEX_RECORD.unpack_from(src_idx, rec * INDEX_RECORD.size))
+            offset = fields[4]
+            line_end = src_dat.find(b"\n", offset)
+            fields[4] = dat_dst.tell()
+            fields[5] = prev
+            dat_dst.write(src_dat[offset:line_end + 1])
+            idx_dst.write(INDEX_RECORD.pack(*fields))
+            written += 1
+            return written - 1
+
+        try:
+            heads.execute("BEGIN")
+            row = first
+            while row is not None:
+                user_id, rec, count = row
+                chain = []
+                for _ in range(count):
+                    chain.append(rec)
+                    rec = INDEX_RECORD.unpack_from(src_idx, rec * INDEX_RECORD.size)[5]
+
+                new_rec = NO_RECORD
+                for rec in reversed(chain):
+                    new_rec = copy(rec, new_rec)
+                heads.execute("INSERT INTO heads VALUES (?, ?, ?)", (user_id, new_rec, count))
+                row = users.fetchone()
+            reader.close()
+            src_idx.close()
+            src_dat.close()
+
+            with self._lock:
+                # Записи, добавленные во время копирования
+                src_idx = self._index_map()
+                src_dat = self._data_map()
+                for rec in range(snapshot, self._count):
+                    user_id = INDEX_RECORD.unpack_from(src_idx, rec * INDEX_RECORD.size)[0]
+                    new_rec = copy(rec, self._head(user_id, heads)[0])
+                    self._link(user_id, new_rec, heads)
+
+                dead = written - heads.execute("SELECT COALESCE(SUM(count), 0) FROM heads").fetchone()[0]
+                self._set_meta(heads, indexed=written, dead=dead)
+                heads.execute("COMMIT")
+                heads.close()
+                for f in (idx_dst, dat_dst):
+                    f.flush()
+                    os.fsync(f.fileno())
+                    f.close()
+
+                self._write_generation(generation)
+                self._close_files()
+                self._generation = generation
+                self._open_generation()
+                self._remove_stale_generations()
+        except BaseException:
+            for resource in (idx_dst, dat_dst, heads, reader):
+                resource.close()
+            raise
+
+        print(f"🧹 История уплотнена: {snapshot} → {self._count} записей")
+
+    def close(self):
+        """Закрывает файлы журнала"""
+        with self._lock:
+            self._close_files()
+            self._names_file.close()
@@ -8,9 +8,15 @@ import os
 import base64
 import json
 import re
-from typing import Tuple
+import threading
+from dataclasses import replace
+from typing import List, Optional, Tuple
 
 from models import AnalysisMode, AnalysisResult
+from backends import BackendPool, load_env
+from breaker import CircuitBreaker
+from cache import ResultCache, image_fingerprint
+from regions import crop_regions, propose_regions
 
 
 class IdentifierAgent:
@@ -18,27 +24,32 @@ class IdentifierAgent:
     Агент идентификации с использованием Perplexity API
     """
     
-    def __init__(self):
-        """Инициализирует агент с проверкой API ключа"""
-        self.api_key = os.getenv("PERPLEXITY_API_KEY")
-        if not self.api_key or self.api_key == "pplx-your_api_key_here":
-            raise ValueError("❌ PERPLEXITY_API_KEY не установлен! Установите в .env файл")
+    def __init__(
+        self,
+        pool: Optional[BackendPool] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        cache: Optional[ResultCache] = None
+    ):
+        """Инициализирует агент с пулом бэкендов (по умолчанию из .env)"""
+        load_env()
+        self.pool = pool
+        self.breaker = breaker or CircuitBreaker.from_env()
+        self.cache = cache or ResultCache()
+        
+        # Ограничение одновременных вызовов модели (общее для всех режимов)
+        self.max_concurrency = int(os.getenv("IDENTIFY_CONCURRENCY", 8))
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
         
-        self.client = None
         self._init_client()
     
     def _init_client(self):
-        """Инициализирует OpenAI клиент для Perplexity"""
-        try:
-            from openai import OpenAI
-            self.client = OpenAI(
-                api_key=self.api_key,
-                base_url="https://api.perplexity.ai"
-            )
-        except ImportError:
-            raise ImportError("❌ openai не установлен. Запустите: pip install openai")
-        except Exception as e:
-            raise Exception(f"❌ Ошибка инициализации Perplexity: {str(e)}")
+        """Инициализирует пул бэкендов (клиенты OpenAI создаются при первом запросе)"""
+        if self.pool is None:
+            self.pool = BackendPool.from_env()
+    
+    def health_check(self):
+        """Проверяет все бэкенды пула"""
+        return self.pool.health_check()
     
     def identify(self, image_path: str, mode: AnalysisMode = AnalysisMode.PAID) -> Tuple[AnalysisResult, int]:
         """
@@ -56,65 +67,203 @@ class IdentifierAgent:
             if not os.path.exists(image_path):
                 raise FileNotFoundError(f"Файл не найден: {image_path}")
             
-            # Кодируем изображение в base64
+            # Читаем изображение
             with open(image_path, "rb") as f:
-                encoded = base64.b64encode(f.read()).decode("utf-8")
+                data = f.read()
             
             # Определяем тип файла
             ext = os.path.splitext(image_path)[1].lower()
             media_type = self._get_media_type(ext)
+        
+        except Exception as e:
+            print(f"❌ Ошибка анализа: {str(e)}")
+            return self._error_result(e), 0
+        
+        return self.identify_bytes(data, media_type, mode)
+    
+    def identify_bytes(
+        self,
+        data: bytes,
+        media_type: str = "image/jpeg",
+        mode: AnalysisMode = AnalysisMode.PAID,
+        use_cache: bool = True
+    ) -> Tuple[AnalysisResult, int]:
+        """
+        Идентифицирует вид на изображении в памяти
+        
+        Args:
+            data: Содержимое изображения
+            media_type: MIME тип изображения
+            mode: Режим анализа (FREE или PAID)
+            use_cache: Сохранять результат в кеш и отвечать из него при отказе модели
+        
+        Returns:
+            (AnalysisResult, количество токенов)
+        """
+        try:
+            # Автомат разомкнут - отвечаем из кеша или сразу отказываем
+            if not self.breaker.allow_request():
+                return self._degraded_result(data if use_cache else None), 0
+            
+            # Кодируем изображение в base64
+            encoded = base64.b64encode(data).decode("utf-8")
             
             # Выбираем промпт в зависимости от режима
             prompt = self._get_prompt(mode)
             
             # Отправляем запрос к Perplexity
             print(f"📡 Отправляю запрос к Perplexity API (режим: {mode.value})...")
-            response = self.client.chat.completions.create(
-                model="sonar",
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:{media_type};base64,{encoded}"
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": prompt
-                        }
-                    ]
-                }],
-                temperature=0.2 if mode == AnalysisMode.PAID else 0.1,
-                max_tokens=1000 if mode == AnalysisMode.PAID else 600,
-                top_p=0.9
-            )
+            try:
+                with self._slots:
+                    response, backend = self.pool.complete(
+                        messages=[{
+                            "role": "user",
+                            "content": [
+                                {
+                                    "type": "image_url",
+                                    "image_url": {
+                                        "url": f"data:{media_type};base64,{encoded}"
+                                    }
+                                },
+                                {
+                                    "type": "text",
+                                    "text": prompt
+                                }
+                            ]
+                        }],
+                        temperature=0.2 if mode == AnalysisMode.PAID else 0.1,
+                        max_tokens=1000 if mode == AnalysisMode.PAID else 600,
+                        top_p=0.9
+                    )
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
             
             # Извлекаем текст ответа
             text = response.choices[0].message.content
             tokens = response.usage.total_tokens if hasattr(response, 'usage') else 0
             
-            print(f"✅ Получен ответ ({tokens} токенов)")
+            print(f"✅ Получен ответ от {backend.name} ({tokens} токенов)")
             
             # Парсим JSON
             result = self._parse_response(text)
+            if use_cache and result.confidence > 0:
+                # Отпечаток (с декодированием для average hash) считается только для кеша
+                self.cache.put(image_fingerprint(data), result)
             
             return result, tokens
         
         except Exception as e:
             print(f"❌ Ошибка анализа: {str(e)}")
-            error_result = AnalysisResult(
-                common_name="Ошибка анализа",
-                scientific_name="N/A",
-                organism_type="unknown",
-                confidence=0.0,
-                characteristics=[str(e)[:100]],
-                habitat="N/A",
-                edibility="unknown",
-                interesting_facts=[]
-            )
-            return error_result, 0
+            return self._error_result(e), 0
+    
+    def identify_multi(
+        self,
+        image_path: str,
+        mode: AnalysisMode = AnalysisMode.FREE,
+        max_regions: int = 3
+    ) -> Tuple[List[AnalysisResult], int]:
+        """
+        Идентифицирует несколько объектов на фото
+        
+        Кадр целиком и до max_regions областей с наибольшей детализацией
+        распознаются параллельно (в пределах IDENTIFY_CONCURRENCY), поэтому
+        общее время близко к одному вызову. Результаты дедуплицируются
+        по scientific_name.
+        
+        Args:
+            image_path: Путь к изображению
+            mode: Режим анализа каждой области
+            max_regions: Максимум областей помимо целого кадра
+        
+        Returns:
+            (список AnalysisResult по убыванию уверенности, количество токенов)
+        """
+        try:
+            if not os.path.exists(image_path):
+                raise FileNotFoundError(f"Файл не найден: {image_path}")
+            
+            with open(image_path, "rb") as f:
+                data = f.read()
+            media_type = self._get_media_type(os.path.splitext(image_path)[1].lower())
+        
+        except Exception as e:
+            print(f"❌ Ошибка анализа: {str(e)}")
+            return [self._error_result(e)], 0
+        
+        # concurrent.futures импортируется лениво, чтобы не замедлять холодный старт
+        from concurrent.futures import ThreadPoolExecutor
+        
+        images = [(data, media_type)]
+        try:
+            boxes = propose_regions(data, max_regions)
+            images += [(crop, "image/jpeg") for crop in crop_regions(data, boxes)]
+            print(f"🔎 Найдено областей: {len(boxes)}")
+        except Exception as e:
+            # Без Pillow или для нечитаемого формата - анализируем только целый кадр
+            print(f"⚠️  Области не выделены: {str(e)[:100]}")
+        
+        with ThreadPoolExecutor(max_workers=min(len(images), self.max_concurrency)) as executor:
+            outcomes = list(executor.map(
+                # В кеш для деградированного режима попадает только целый кадр
+                lambda image: self.identify_bytes(image[0], image[1], mode, use_cache=image[0] is data),
+                images
+            ))
+        
+        tokens = sum(t for _, t in outcomes)
+        return self._deduplicate([result for result, _ in outcomes]), tokens
+    
+    @staticmethod
+    def _deduplicate(results: List[AnalysisResult]) -> List[AnalysisResult]:
+        """Оставляет по одному результату на вид, с наибольшей уверенностью"""
+        best = {}
+        for result in results:
+            if result.scientific_name == "N/A":
+                continue
+            key = result.scientific_name.strip().lower()
+            if key not in best or result.confidence > best[key].confidence:
+                best[key] = result
+        
+        if not best:
+            # Все вызовы завершились ошибкой - возвращаем первую
+            return results[:1]
+        return sorted(best.values(), key=lambda r: r.confidence, reverse=True)
+    
+    @staticmethod
+    def _error_result(error: Exception) -> AnalysisResult:
+        """Результат-заглушка для ошибки анализа"""
+        return AnalysisResult(
+            common_name="Ошибка анализа",
+            scientific_name="N/A",
+            organism_type="unknown",
+            confidence=0.0,
+            characteristics=[str(error)[:100]],
+            habitat="N/A",
+            edibility="unknown",
+            interesting_facts=[]
+        )
+    
+    def _degraded_result(self, data: Optional[bytes]) -> AnalysisResult:
+        """Ответ при разомкнутом автомате: результат из кеша или быстрый отказ"""
+        cached = None
+        if data is not None and len(self.cache):
+            cached = self.cache.get(image_fingerprint(data))
+        if cached is not None:
+            print("♻️  Сервис недоступен, отвечаю из кеша")
+            return replace(cached, cached=True)
+        
+        print("⛔ Сервис недоступен, запрос отклонен")
+        return AnalysisResult(
+            common_name="Сервис временно недоступен",
+            scientific_name="N/A",
+            organism_type="unknown",
+            confidence=0.0,
+            characteristics=["Сервис анализа временно недоступен, попробуйте через минуту"],
+            habitat="N/A",
+            edibility="unknown",
+            interesting_facts=[]
+        )
     
     @staticmethod
     def _get_media_type(ext: str) -> str:
@@ -12,6 +12,7 @@ class AnalysisMode(Enum):
     """Режимы анализа"""
     FREE = "free"      # Бесплатный: быстрый анализ
     PAID = "paid"      # Платный: расширенный анализ
+    MULTI = "multi"    # Несколько объектов: параллельный анализ областей
 
 
 @dataclass
@@ -27,6 +28,7 @@ class AnalysisResult:
     edibility: str
     interesting_facts: list
     family: str = ""
+    cached: bool = False
     
     def to_message(self) -> str:
         """Форматирует результат для отправки в чат"""
@@ -50,6 +52,8 @@ class AnalysisResult:
 ✨ *Интересные факты:*
 {chr(10).join(f"• {f}" for f in self.interesting_facts[:3])}
 """
+        if self.cached:
+            msg += "\n♻️ *Результат из кеша* - сервис анализа временно недоступен\n"
         return msg
 
 
@@ -68,3 +72,12 @@ class UserData:
             "total_images": self.total_images,
             "total_tokens_used": self.total_tokens_used
         }
+
+
+@dataclass
+class HistoryEntry:
+    """Запись истории идентификаций"""
+    timestamp: int
+    scientific_name: str
+    confidence: float
+    result: AnalysisResult
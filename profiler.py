@@ -0,0 +1,236 @@
+# ═════════════════════════════════════════════════════════════════
+# 🌿 PLANT RECOGNITION BOT - SAMPLING PROFILER
+# ═════════════════════════════════════════════════════════════════
+# Встроенный сэмплирующий профайлер для диагностики в продакшене
+# ═════════════════════════════════════════════════════════════════
+#
+# Фоновый поток раз в interval секунд снимает стеки всех потоков
+# (sys._current_frames) и await-цепочки всех asyncio задач, и пишет
+# их в collapsed-stack формат, который понимают flamegraph.pl,
+# speedscope и inferno:
+#
+#   thread:MainThread;asyncio.base_events:BaseEventLoop.run_forever;... 42
+#   task:Task-7;handlers:BotHandlers.photo_handler;... 17
+# ═════════════════════════════════════════════════════════════════
+
+import os
+import sys
+import time
+import asyncio
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+def _function(module: str, *names: str):
+    """
+    Проверка метки кадра по модулю и имени функции
+
+    Класс в метке не учитывается: co_qualname есть только с Python 3.11,
+    на более старых версиях метка содержит лишь co_name.
+    """
+    prefix = f"{module}:"
+
+    def matches(label: str) -> bool:
+        return label.startswith(prefix) and label[len(prefix):].rsplit(".", 1)[-1] in names
+
+    return matches
+
+
+# Что показывать в сводке: название -> проверка метки кадра
+TARGETS = {
+    "photo_handler": _function("handlers", "photo_handler"),
+    # В режиме 🔎 вызовы модели идут из identify_multi через identify_bytes
+    "IdentifierAgent.identify": _function("identifier", "identify", "identify_bytes", "identify_multi"),
+    "_parse_response": _function("identifier", "_parse_response"),
+    # Только кадры сетевых вызовов: telegram.ext (run_polling, process_update)
+    # лежит в корне почти каждого стека и не говорит об ожидании сети
+    "Telegram I/O": lambda label: label.startswith(("telegram._bot:", "telegram.request")),
+}
+
+
+@dataclass
+class ProfileReport:
+    """Итог сессии профилирования"""
+    path: str
+    duration: float
+    ticks: int
+    # Доля тиков, в которые функция была хоть в одном стеке
+    attribution: Dict[str, float] = field(default_factory=dict)
+
+    def to_message(self) -> str:
+        """Форматирует сводку для отправки в чат"""
+        lines = "\n".join(f"• {name}: {share * 100:.0f}%" for name, share in self.attribution.items())
+        return f"""
+🔬 *Профиль готов*
+
+⏱ *Длительность:* {self.duration:.0f} сек
+📈 *Сэмплов:* {self.ticks}
+📁 *Файл:* `{self.path}`
+
+*Доля времени в стеке:*
+{lines}
+"""
+
+
+def _label(frame) -> str:
+    """Метка кадра: модуль:квалифицированное_имя (до Python 3.11 - модуль:имя)"""
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{module}:{name}".replace(";", ":").replace(" ", "_")
+
+
+def _thread_stack(frame) -> List[str]:
+    """Стек потока от корня к листу"""
+    stack = []
+    while frame is not None:
+        stack.append(_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _task_stack(task: asyncio.Task) -> List[str]:
+    """Await-цепочка задачи от корня к листу"""
+    stack = []
+    coro = task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        stack.append(_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return stack
+
+
+class SamplingProfiler:
+    """
+    Сэмплирующий профайлер, включаемый без перезапуска
+
+    Одновременно идет не больше одной сессии. Сессия завершается сама
+    через duration секунд или по stop(), после чего стеки записываются
+    в файл в output_dir.
+    """
+
+    def __init__(self, output_dir: str = "profiles", interval: float = 0.01):
+        self.output_dir = output_dir
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._report: Optional[ProfileReport] = None
+
+    @classmethod
+    def from_env(cls) -> "SamplingProfiler":
+        """Создает профайлер с параметрами из переменных окружения"""
+        return cls(
+            output_dir=os.getenv("PROFILE_DIR", "profiles"),
+            interval=float(os.getenv("PROFILE_INTERVAL", 0.01))
+        )
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration: float, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        Запускает сессию профилирования
+
+        Args:
+            duration: Длительность в секундах
+            loop: Event loop, задачи которого тоже сэмплируются
+        """
+        with self._lock:
+            if self.is_running:
+                raise RuntimeError("Профилирование уже запущено")
+            self._stop.clear()
+            self._report = None
+            self._thread = threading.Thread(
+                target=self._run, args=(duration, loop), name="profiler", daemon=True
+            )
+            self._thread.start()
+        print(f"🔬 Профилирование запущено на {duration:.0f} сек")
+
+    def stop(self):
+        """Досрочно завершает сессию"""
+        self._stop.set()
+
+    def join(self) -> Optional[ProfileReport]:
+        """Ждет завершения сессии и возвращает ее итог"""
+        thread = self._thread
+        if thread is not None:
+            thread.join()
+        return self._report
+
+    # ═════════════════════════════════════════════════════════════════
+    # 📈 СЭМПЛИРОВАНИЕ
+    # ═════════════════════════════════════════════════════════════════
+
+    def _sample(self, loop: Optional[asyncio.AbstractEventLoop]) -> List[List[str]]:
+        """Снимает стеки всех потоков и задач"""
+        stacks = []
+        names = {t.ident: t.name for t in threading.enumerate()}
+        own = threading.get_ident()
+
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stacks.append([f"thread:{names.get(ident, ident)}"] + _thread_stack(frame))
+
+        if loop is not None and not loop.is_closed():
+            try:
+                # all_tasks не потокобезопасен: при гонке пропускаем тик
+                tasks = list(asyncio.all_tasks(loop))
+            except RuntimeError:
+                tasks = []
+            for task in tasks:
+                stack = _task_stack(task)
+                if stack:
+                    stacks.append([f"task:{task.get_name()}"] + stack)
+
+        return stacks
+
+    def _run(self, duration: float, loop: Optional[asyncio.AbstractEventLoop]):
+        counts: Counter = Counter()
+        hits: Counter = Counter()
+        ticks = 0
+        started = time.monotonic()
+        deadline = started + duration
+
+        while not self._stop.is_set() and time.monotonic() < deadline:
+            stacks = self._sample(loop)
+            ticks += 1
+
+            seen = set()
+            for stack in stacks:
+                counts[";".join(stack)] += 1
+                for name, matches in TARGETS.items():
+                    if name not in seen and any(matches(label) for label in stack):
+                        seen.add(name)
+            hits.update(seen)
+
+            self._stop.wait(self.interval)
+
+        elapsed = time.monotonic() - started
+        path = self._write(counts)
+        self._report = ProfileReport(
+            path=path,
+            duration=elapsed,
+            ticks=ticks,
+            attribution={name: hits[name] / ticks if ticks else 0.0 for name in TARGETS}
+        )
+        print(f"🔬 Профиль записан: {path} ({ticks} сэмплов)")
+
+    def _write(self, counts: Counter) -> str:
+        """Записывает стеки в collapsed-stack формате"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        name = datetime.now().strftime("profile-%Y%m%d-%H%M%S.folded")
+        path = os.path.join(self.output_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in counts.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
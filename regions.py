@@ -0,0 +1,111 @@
+# ═════════════════════════════════════════════════════════════════
+# 🌿 PLANT RECOGNITION BOT - REGION PROPOSALS
+# ═════════════════════════════════════════════════════════════════
+# Локальный поиск областей с объектами для мульти-режима
+# ═════════════════════════════════════════════════════════════════
+
+from io import BytesIO
+from typing import List, Tuple
+
+
+Box = Tuple[int, int, int, int]
+
+
+def _import_pil():
+    """Pillow нужен только мульти-режиму, поэтому импортируется лениво"""
+    try:
+        from PIL import Image, ImageFilter, ImageStat
+    except ImportError:
+        raise ImportError("❌ Pillow не установлен. Запустите: pip install Pillow")
+    return Image, ImageFilter, ImageStat
+
+
+def _iou(a: Box, b: Box) -> float:
+    """Пересечение над объединением двух прямоугольников"""
+    left, top = max(a[0], b[0]), max(a[1], b[1])
+    right, bottom = min(a[2], b[2]), min(a[3], b[3])
+    if right <= left or bottom <= top:
+        return 0.0
+    inter = (right - left) * (bottom - top)
+    area_a = (a[2] - a[0]) * (a[3] - a[1])
+    area_b = (b[2] - b[0]) * (b[3] - b[1])
+    return inter / (area_a + area_b - inter)
+
+
+def propose_regions(
+    data: bytes,
+    max_regions: int = 3,
+    grid: int = 3,
+    max_iou: float = 0.3,
+    min_score_ratio: float = 0.5
+) -> List[Box]:
+    """
+    Предлагает области с наибольшей детализацией
+
+    Кадр покрывается сеткой grid x grid перекрывающихся окон размером
+    в половину кадра. Оценка окна - средняя энергия границ (FIND_EDGES)
+    на уменьшенной копии: фон вроде неба или земли дает низкую оценку.
+    Лучшие окна отбираются с подавлением сильно перекрывающихся.
+
+    Args:
+        data: Содержимое изображения
+        max_regions: Максимум областей
+        grid: Количество позиций окна по каждой оси
+        max_iou: Максимальное перекрытие отобранных окон
+        min_score_ratio: Окна слабее этой доли от лучшего отбрасываются
+
+    Returns:
+        Список прямоугольников (left, top, right, bottom) в пикселях оригинала
+    """
+    Image, ImageFilter, ImageStat = _import_pil()
+
+    with Image.open(BytesIO(data)) as img:
+        width, height = img.size
+        preview = img.convert("L")
+        preview.thumbnail((256, 256))
+        edges = preview.filter(ImageFilter.FIND_EDGES)
+
+    scale_x = width / edges.width
+    scale_y = height / edges.height
+    win_w, win_h = edges.width // 2, edges.height // 2
+    step_x = (edges.width - win_w) / max(grid - 1, 1)
+    step_y = (edges.height - win_h) / max(grid - 1, 1)
+
+    candidates = []
+    for row in range(grid):
+        for col in range(grid):
+            left, top = int(col * step_x), int(row * step_y)
+            window = (left, top, left + win_w, top + win_h)
+            score = ImageStat.Stat(edges.crop(window)).mean[0]
+            box = (
+                int(window[0] * scale_x), int(window[1] * scale_y),
+                int(window[2] * scale_x), int(window[3] * scale_y)
+            )
+            candidates.append((score, box))
+
+    candidates.sort(reverse=True)
+    best_score = candidates[0][0] if candidates else 0.0
+
+    chosen: List[Box] = []
+    for score, box in candidates:
+        if len(chosen) >= max_regions or score < best_score * min_score_ratio:
+            break
+        if all(_iou(box, other) <= max_iou for other in chosen):
+            chosen.append(box)
+    return chosen
+
+
+def crop_regions(data: bytes, boxes: List[Box], max_side: int = 1024) -> List[bytes]:
+    """Вырезает области и кодирует их в JPEG"""
+    Image, _, _ = _import_pil()
+
+    crops = []
+    with Image.open(BytesIO(data)) as img:
+        img = img.convert("RGB")
+        for box in boxes:
+            crop = img.crop(box)
+            crop.thumbnail((max_side, max_side))
+            buffer = BytesIO()
+            crop.save(buffer, format="JPEG", quality=85)
+            crops.append(buffer.getvalue())
+    return crops
@@ -0,0 +1,139 @@
+# ═════════════════════════════════════════════════════════════════
+# 🧪 ТЕСТЫ: ПУЛ БЭКЕНДОВ
+# ═════════════════════════════════════════════════════════════════
+
+from collections import Counter
+
+import pytest
+
+from backends import BackendConfig, BackendPool
+
+
+def make_pool(*weights):
+    configs = [
+        BackendConfig(name=f"b{i}", api_key="", base_url="fake://local", weight=weight)
+        for i, weight in enumerate(weights)
+    ]
+    pool = BackendPool(configs)
+    pool._random.seed(1)
+    return pool
+
+
+def route(pool, calls=1000):
+    counts = Counter()
+    for _ in range(calls):
+        _, backend = pool.complete(messages=[])
+        counts[backend.name] += 1
+    return counts
+
+
+def test_traffic_is_split_between_healthy_backends():
+    counts = route(make_pool(1.0, 1.0))
+    assert 400 < counts["b0"] < 600
+    assert 400 < counts["b1"] < 600
+
+
+def test_traffic_follows_weights():
+    counts = route(make_pool(3.0, 1.0))
+    assert 650 < counts["b0"] < 850
+
+
+def test_failover_order_follows_score():
+    pool = make_pool(1.0, 1.0, 1.0)
+    b0, b1, b2 = pool.backends
+    b1.latency_ewma, b2.latency_ewma = 0.1, 2.0
+    order = pool._ranked()
+    assert len(order) == 3
+    rest = order[1:]
+    # Запасные идут по возрастанию оценки (без замеров - первыми)
+    assert rest == sorted(rest, key=lambda b: (b.latency_ewma is not None, b.score(pool.error_penalty)))
+
+
+def test_failing_backend_is_ejected_and_skipped():
+    pool = make_pool(1.0, 1.0)
+    broken = pool.backends[0]
+
+    def fail(**kwargs):
+        raise RuntimeError("boom")
+
+    broken.client.chat.completions.create = fail
+    counts = route(pool, 100)
+    assert counts["b1"] == 100
+    assert not broken.is_healthy(broken.ejected_until - 1)
+
+
+def test_all_backends_failing_raises_last_error():
+    pool = make_pool(1.0)
+
+    def fail(**kwargs):
+        raise RuntimeError("boom")
+
+    pool.backends[0].client.chat.completions.create = fail
+    with pytest.raises(RuntimeError, match="boom"):
+        pool.complete(messages=[])
+
+
+def test_health_check_runs_backends_in_parallel():
+    import time
+
+    pool = make_pool(1.0, 1.0, 1.0)
+    for backend in pool.backends:
+        def slow(**kwargs):
+            time.sleep(0.2)
+        backend.client.chat.completions.create = slow
+
+    start = time.monotonic()
+    results = pool.health_check()
+    assert [ok for _, ok, _ in results] == [True, True, True]
+    assert time.monotonic() - start < 0.5
+
+
+def test_from_env_loads_dotenv(tmp_path, monkeypatch):
+    pytest.importorskip("dotenv")
+    import backends
+
+    (tmp_path / ".env").write_text('PERPLEXITY_BACKENDS=[{"name": "env", "base_url": "fake://env"}]\n')
+    monkeypatch.chdir(tmp_path)
+    # setenv запоминает исходное значение, и оно восстановится после теста
+    monkeypatch.setenv("PERPLEXITY_BACKENDS", "")
+    monkeypatch.delenv("PERPLEXITY_BACKENDS")
+    monkeypatch.setattr(backends, "_env_loaded", False)
+
+    pool = BackendPool.from_env()
+    assert [b.name for b in pool.backends] == ["env"]
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def test_request_errors_are_raised_without_failover():
+    pool = make_pool(1.0, 1.0)
+    calls = []
+
+    def bad_request(**kwargs):
+        calls.append(1)
+        raise StatusError(400)
+
+    for backend in pool.backends:
+        backend.client.chat.completions.create = bad_request
+
+    with pytest.raises(StatusError):
+        pool.complete(messages=[])
+    assert calls == [1]
+    assert all(b.error_ewma == 0.0 and b.consecutive_failures == 0 for b in pool.backends)
+
+
+def test_rate_limited_backend_fails_over():
+    pool = make_pool(1.0, 1.0)
+    limited = pool.backends[0]
+
+    def too_many_requests(**kwargs):
+        raise StatusError(429)
+
+    limited.client.chat.completions.create = too_many_requests
+    counts = route(pool, 20)
+    assert counts["b1"] == 20
+    assert limited.error_ewma > 0
@@ -0,0 +1,51 @@
+# ═════════════════════════════════════════════════════════════════
+# 🧪 ТЕСТЫ: CIRCUIT BREAKER
+# ═════════════════════════════════════════════════════════════════
+
+from breaker import BreakerState, CircuitBreaker
+
+
+def open_breaker(**kwargs):
+    breaker = CircuitBreaker(min_calls=2, window_size=2, **kwargs)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == BreakerState.OPEN
+    return breaker
+
+
+def test_half_open_then_closed_after_success():
+    breaker = open_breaker(open_timeout=0.0)
+    assert breaker.allow_request()
+    assert breaker.state == BreakerState.HALF_OPEN
+    # Пробный вызов уже идет - остальные отклоняются
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == BreakerState.CLOSED
+
+
+def test_rejections_are_exported_throttled(tmp_path, monkeypatch):
+    path = tmp_path / "breaker.prom"
+    breaker = open_breaker(open_timeout=60.0, metrics_path=str(path), metrics_interval=60.0)
+
+    writes = []
+    original = breaker._export_metrics
+    monkeypatch.setattr(breaker, "_export_metrics", lambda: (writes.append(1), original()))
+
+    for _ in range(100):
+        assert not breaker.allow_request()
+    assert breaker.rejected_calls == 100
+    # Переход в OPEN только что записал файл, отказы его не переписывают
+    assert writes == []
+
+    breaker._exported_at = 0.0
+    assert not breaker.allow_request()
+    assert writes == [1]
+    assert 'circuit_breaker_rejected_total{breaker="model"} 101' in path.read_text()
+
+
+def test_half_open_rejections_are_exported(tmp_path):
+    path = tmp_path / "breaker.prom"
+    breaker = open_breaker(open_timeout=0.0, metrics_path=str(path), metrics_interval=0.0)
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    assert 'circuit_breaker_rejected_total{breaker="model"} 1' in path.read_text()
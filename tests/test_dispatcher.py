@@ -0,0 +1,89 @@
+# ═════════════════════════════════════════════════════════════════
+# 🧪 ТЕСТЫ: ДИСПЕТЧЕР СООБЩЕНИЙ
+# ═════════════════════════════════════════════════════════════════
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("telegram")
+
+from telegram.error import RetryAfter
+
+from dispatcher import MessageDispatcher
+
+
+def test_group_chats_use_stricter_interval():
+    async def run():
+        dispatcher = MessageDispatcher(chat_interval=1.0, group_interval=3.0)
+        return dispatcher._chat_limiter(42).interval, dispatcher._chat_limiter(-100500).interval
+
+    assert asyncio.run(run()) == (1.0, 3.0)
+
+
+def test_retry_after_delays_global_limiter():
+    async def run():
+        dispatcher = MessageDispatcher()
+        calls = []
+
+        async def send():
+            calls.append(asyncio.get_running_loop().time())
+            if len(calls) == 1:
+                raise RetryAfter(1)
+            return "ok"
+
+        start = asyncio.get_running_loop().time()
+        result = await dispatcher._call(1, send)
+        return result, calls[1] - start, dispatcher.global_limiter._next_slot - start
+
+    result, retried_after, global_slot = asyncio.run(run())
+    assert result == "ok"
+    assert retried_after >= 1.0
+    assert global_slot >= 1.0
+
+
+def test_chat_actions_do_not_take_limiter_slots():
+    async def run():
+        dispatcher = MessageDispatcher(global_rate=1.0)
+        sent = []
+
+        class Bot:
+            async def send_chat_action(self, chat_id, action):
+                sent.append(chat_id)
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for chat_id in range(1, 6):
+            await dispatcher.send_action(Bot(), chat_id)
+        slot = dispatcher.global_limiter._next_slot
+        return sent, slot <= start, loop.time() - start
+
+    sent, untouched, elapsed = asyncio.run(run())
+    assert sent == [1, 2, 3, 4, 5]
+    assert untouched
+    assert elapsed < 0.5
+
+
+def test_chat_action_is_skipped_while_messages_wait():
+    async def run():
+        dispatcher = MessageDispatcher(global_rate=1.0)
+        sent = []
+
+        class Bot:
+            async def send_chat_action(self, chat_id, action):
+                sent.append(chat_id)
+
+        async def send():
+            return "ok"
+
+        # Два сообщения: второе ждет слота глобального лимитера
+        first = await dispatcher._call(1, send)
+        waiting = asyncio.create_task(dispatcher._call(2, send))
+        await asyncio.sleep(0)
+        await dispatcher.send_action(Bot(), 3)
+        second = await waiting
+        return sent, first, second
+
+    sent, first, second = asyncio.run(run())
+    assert sent == []
+    assert (first, second) == ("ok", "ok")
@@ -0,0 +1,177 @@
+# ═════════════════════════════════════════════════════════════════
+# 🧪 ТЕСТЫ: ЖУРНАЛ ИСТОРИИ
+# ═════════════════════════════════════════════════════════════════
+
+import os
+
+import pytest
+
+from history import INDEX_RECORD, HistoryLog
+from models import AnalysisResult
+
+
+def result(name: str) -> AnalysisResult:
+    return AnalysisResult(
+        common_name=f"Растение {name}\nсо второй строкой",
+        scientific_name=name,
+        family="Testaceae",
+        organism_type="растение",
+        confidence=0.9,
+        characteristics=["лист"],
+        habitat="лес",
+        edibility="нет",
+        interesting_facts=[]
+    )
+
+
+@pytest.fixture
+def open_log(tmp_path):
+    logs = []
+
+    def open_(**kwargs):
+        kwargs.setdefault("max_per_user", 5)
+        kwargs.setdefault("min_dead_to_compact", 10 ** 9)
+        log = HistoryLog(directory=str(tmp_path), **kwargs)
+        logs.append(log)
+        return log
+
+    yield open_
+    for log in logs:
+        try:
+            log.close()
+        except Exception:
+            pass
+
+
+def names(entries):
+    return [entry.scientific_name for entry in entries]
+
+
+def test_append_and_page_newest_first(open_log):
+    log = open_log()
+    for i in range(7):
+        log.append(1, result(f"A{i}"), timestamp=i)
+    log.append(2, result("B0"))
+
+    assert log.count(1) == 5
+    assert log.count(2) == 1
+    assert log.count(3) == 0
+    assert names(log.page(1, 0, page_size=2)) == ["A6", "A5"]
+    assert names(log.page(1, 1, page_size=2)) == ["A4", "A3"]
+    # Записи сверх лимита не показываются
+    assert names(log.page(1, 2, page_size=2)) == ["A2"]
+    assert log.page(1, 3, page_size=2) == []
+    assert log.page(3, 0) == []
+
+    entry = log.page(1, 0)[0]
+    assert entry.timestamp == 6
+    assert entry.result.common_name == "Растение A6\nсо второй строкой"
+
+
+def test_reopen_keeps_history(open_log):
+    log = open_log()
+    for i in range(3):
+        log.append(1, result(f"A{i}"))
+    log.close()
+
+    log = open_log()
+    assert log.count(1) == 3
+    log.append(1, result("A3"))
+    assert names(log.page(1, 0)) == ["A3", "A2", "A1", "A0"]
+
+
+def test_reopen_replays_records_missing_from_heads(open_log):
+    log = open_log()
+    log.append(1, result("A0"))
+    idx_path = log.idx_path
+    log.close()
+
+    # Сбой между записью индекса и коммитом таблицы последних записей
+    with open(idx_path, "ab") as f:
+        f.write(INDEX_RECORD.pack(1, 0, 0, 0.5, 0, 0))
+        f.write(b"\0" * 5)
+
+    log = open_log()
+    assert log.count(1) == 2
+    assert log.page(1, 0)[1].scientific_name == "A0"
+    assert os.path.getsize(idx_path) == 2 * INDEX_RECORD.size
+
+
+def test_compact_drops_dead_records_and_switches_generation(open_log, tmp_path):
+    log = open_log()
+    for i in range(20):
+        log.append(1, result(f"A{i}"))
+        log.append(2, result(f"B{i}"))
+    assert log._dead == 30
+
+    old_idx = log.idx_path
+    log.compact()
+
+    assert log._count == 10 and log._dead == 0
+    assert not os.path.exists(old_idx)
+    assert names(log.page(1, 0, page_size=5)) == [f"A{i}" for i in range(19, 14, -1)]
+    assert names(log.page(2, 0, page_size=5)) == [f"B{i}" for i in range(19, 14, -1)]
+
+    log.append(1, result("A20"))
+    log.close()
+
+    log = open_log()
+    assert log._count == 11
+    assert names(log.page(1, 0, page_size=2)) == ["A20", "A19"]
+    assert log.count(1) == 5
+
+
+def test_interrupted_compaction_keeps_old_generation(open_log, tmp_path):
+    log = open_log()
+    for i in range(8):
+        log.append(1, result(f"A{i}"))
+    log.close()
+
+    # Недописанное новое поколение без переключения CURRENT
+    for suffix in ("idx", "dat", "heads"):
+        (tmp_path / f"history.1.{suffix}").write_bytes(b"garbage")
+
+    log = open_log()
+    assert names(log.page(1, 0)) == [f"A{i}" for i in range(7, 2, -1)]
+    assert not (tmp_path / "history.1.idx").exists()
+
+
+def test_background_compaction_with_concurrent_appends(open_log):
+    log = open_log(max_per_user=2, min_dead_to_compact=10)
+    for i in range(200):
+        log.append(i % 3, result(f"U{i % 3}-{i}"))
+
+    # Дожидаемся фонового уплотнения
+    log.compact()
+    for user_id in range(3):
+        entries = log.page(user_id, 0, page_size=10)
+        expected = [i for i in range(199, -1, -1) if i % 3 == user_id][:2]
+        assert names(entries) == [f"U{user_id}-{i}" for i in expected]
+    assert log._count - log._dead == 6
+
+
+def test_names_with_line_separators_survive_reopen(open_log):
+    log = open_log()
+    log.append(1, result("Amanita\rmuscaria"))
+    log.append(1, result("Pteridium aquilinum"))
+    log.append(1, result("Fern"))
+    log.close()
+
+    log = open_log()
+    assert names(log.page(1, 0)) == ["Fern", "Pteridium aquilinum", "Amanita muscaria"]
+    log.append(1, result("Fern"))
+    assert log.page(1, 0)[0].scientific_name == "Fern"
+    assert len(log._names) == 3
+
+
+def test_check_from_env_does_not_touch_files(open_log, tmp_path, monkeypatch):
+    log = open_log()
+    for i in range(3):
+        log.append(1, result(f"A{i}"))
+    # Файлы уплотнения, которое идет в работающем боте
+    (tmp_path / "history.1.idx").write_bytes(b"new generation")
+
+    before = {p.name: p.read_bytes() for p in tmp_path.iterdir()}
+    monkeypatch.setenv("HISTORY_DIR", str(tmp_path))
+    assert "3 записей" in HistoryLog.check_from_env()
+    assert {p.name: p.read_bytes() for p in tmp_path.iterdir()} == before
@@ -0,0 +1,89 @@
+# ═════════════════════════════════════════════════════════════════
+# 🧪 ТЕСТЫ: АГЕНТ ИДЕНТИФИКАЦИИ (fake:// бэкенд)
+# ═════════════════════════════════════════════════════════════════
+
+import pytest
+
+import identifier
+from backends import BackendConfig, BackendPool
+from breaker import BreakerState, CircuitBreaker
+from cache import ResultCache
+from identifier import IdentifierAgent
+from models import AnalysisMode
+
+
+@pytest.fixture
+def agent():
+    pool = BackendPool([BackendConfig(name="fake", api_key="", base_url="fake://local")])
+    breaker = CircuitBreaker(min_calls=1, window_size=1, open_timeout=60.0)
+    return IdentifierAgent(pool=pool, breaker=breaker, cache=ResultCache())
+
+
+def open_breaker(agent):
+    agent.breaker.record_failure()
+    assert agent.breaker.state == BreakerState.OPEN
+
+
+def count_fingerprints(monkeypatch):
+    calls = []
+    original = identifier.image_fingerprint
+    monkeypatch.setattr(identifier, "image_fingerprint", lambda data: (calls.append(data), original(data))[1])
+    return calls
+
+
+def test_identify_bytes_with_fake_backend(agent):
+    result, tokens = agent.identify_bytes(b"image", mode=AnalysisMode.FREE)
+    assert result.scientific_name == "Plantae fakeus"
+    assert result.confidence > 0
+    assert not result.cached
+
+
+def test_open_breaker_answers_from_cache(agent):
+    fresh, _ = agent.identify_bytes(b"image")
+    open_breaker(agent)
+
+    result, tokens = agent.identify_bytes(b"image")
+    assert result.cached
+    assert result.scientific_name == fresh.scientific_name
+    assert tokens == 0
+
+
+def test_open_breaker_fails_fast_without_cache(agent):
+    open_breaker(agent)
+
+    def must_not_call(**kwargs):
+        raise AssertionError("модель не должна вызываться")
+
+    agent.pool.backends[0].client.chat.completions.create = must_not_call
+    result, tokens = agent.identify_bytes(b"unknown image")
+    assert result.scientific_name == "N/A"
+    assert result.confidence == 0.0
+    assert not result.cached
+    assert tokens == 0
+
+
+def test_fingerprint_only_for_cache(agent, monkeypatch):
+    calls = count_fingerprints(monkeypatch)
+
+    # Без кеша отпечаток не нужен
+    agent.identify_bytes(b"crop", use_cache=False)
+    assert calls == []
+
+    # Ошибка модели - сохранять нечего
+    def fail(**kwargs):
+        raise RuntimeError("boom")
+
+    backend = agent.pool.backends[0]
+    original = backend.client.chat.completions.create
+    backend.client.chat.completions.create = fail
+    agent.identify_bytes(b"image")
+    assert calls == []
+
+    # Автомат разомкнут, кеш пуст - отказ без отпечатка
+    agent.identify_bytes(b"image")
+    assert calls == []
+
+    agent.breaker._transition(BreakerState.CLOSED)
+    backend.client.chat.completions.create = original
+    agent.identify_bytes(b"image")
+    assert calls == [b"image"]
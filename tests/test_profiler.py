@@ -0,0 +1,37 @@
+# ═════════════════════════════════════════════════════════════════
+# 🧪 ТЕСТЫ: ПРОФАЙЛЕР
+# ═════════════════════════════════════════════════════════════════
+
+import pytest
+
+from profiler import TARGETS
+
+
+@pytest.mark.parametrize("label, target", [
+    # Python 3.11+: co_qualname
+    ("handlers:BotHandlers.photo_handler", "photo_handler"),
+    ("identifier:IdentifierAgent.identify", "IdentifierAgent.identify"),
+    ("identifier:IdentifierAgent._parse_response", "_parse_response"),
+    # Python 3.9-3.10: только co_name
+    ("handlers:photo_handler", "photo_handler"),
+    ("identifier:identify", "IdentifierAgent.identify"),
+    ("identifier:_parse_response", "_parse_response"),
+    ("telegram._bot:Bot.send_message", "Telegram I/O"),
+    ("telegram.request._httpxrequest:HTTPXRequest.do_request", "Telegram I/O"),
+    # Режим нескольких объектов
+    ("identifier:IdentifierAgent.identify_bytes", "IdentifierAgent.identify"),
+    ("identifier:identify_multi", "IdentifierAgent.identify"),
+])
+def test_targets_match_labels_on_all_versions(label, target):
+    assert [name for name, matches in TARGETS.items() if matches(label)] == [target]
+
+
+@pytest.mark.parametrize("label", [
+    "cache:photo_handler",
+    # Корни стеков бота: без фильтра Telegram I/O был бы ~100%
+    "telegram.ext._application:Application.run_polling",
+    "telegram.ext._application:Application.process_update",
+    "telegram.ext._updater:Updater._start_polling",
+])
+def test_targets_ignore_other_frames(label):
+    assert not any(matches(label) for matches in TARGETS.values())
@@ -0,0 +1,179 @@
+# ═════════════════════════════════════════════════════════════════
+# 🧪 ТЕСТЫ: РЕЖИМ НЕСКОЛЬКИХ ОБЪЕКТОВ
+# ═════════════════════════════════════════════════════════════════
+
+import json
+from io import BytesIO
+from types import SimpleNamespace
+
+import pytest
+
+import identifier
+from backends import BackendConfig, BackendPool, FakeClient
+from breaker import CircuitBreaker
+from cache import ResultCache
+from identifier import IdentifierAgent
+from models import AnalysisMode, AnalysisResult
+from regions import _iou, crop_regions, propose_regions
+
+
+def make_result(name: str, confidence: float) -> AnalysisResult:
+    return AnalysisResult(
+        common_name=name, scientific_name=name, organism_type="растение",
+        confidence=confidence, characteristics=[], habitat="", edibility="",
+        interesting_facts=[]
+    )
+
+
+@pytest.fixture
+def agent():
+    pool = BackendPool([BackendConfig(name="fake", api_key="", base_url="fake://local")])
+    return IdentifierAgent(pool=pool, breaker=CircuitBreaker(), cache=ResultCache())
+
+
+@pytest.fixture
+def photo(tmp_path):
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(b"whole frame")
+    return str(path)
+
+
+def respond(agent, answers):
+    """Фейковый бэкенд отвечает по содержимому изображения: {data: (название, уровень уверенности)}"""
+    calls = []
+
+    def create(messages, **kwargs):
+        url = messages[0]["content"][0]["image_url"]["url"]
+        data = identifier.base64.b64decode(url.split(",", 1)[1])
+        calls.append(data)
+        name, confidence = answers[data]
+        text = json.dumps(dict(FakeClient.RESPONSE, scientific_name=name, confidence=confidence))
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+            usage=SimpleNamespace(total_tokens=10)
+        )
+
+    agent.pool.backends[0].client.chat.completions.create = create
+    return calls
+
+
+def use_regions(monkeypatch, crops):
+    monkeypatch.setattr(identifier, "propose_regions", lambda data, max_regions: [(0, 0, 1, 1)] * len(crops))
+    monkeypatch.setattr(identifier, "crop_regions", lambda data, boxes: list(crops))
+
+
+# ═════════════════════════════════════════════════════════════════
+# 🔎 identify_multi
+# ═════════════════════════════════════════════════════════════════
+
+def test_multi_deduplicates_by_scientific_name(agent, photo, monkeypatch):
+    use_regions(monkeypatch, [b"crop-1", b"crop-2", b"crop-3"])
+    calls = respond(agent, {
+        b"whole frame": ("Quercus robur", "средний"),
+        b"crop-1": ("quercus robur ", "высокий"),
+        b"crop-2": ("Amanita muscaria", "средний"),
+        b"crop-3": ("Amanita muscaria", "низкий"),
+    })
+
+    results, tokens = agent.identify_multi(photo, AnalysisMode.FREE)
+
+    assert sorted(calls) == [b"crop-1", b"crop-2", b"crop-3", b"whole frame"]
+    assert [(r.scientific_name, r.confidence) for r in results] == [
+        ("quercus robur ", 0.9),
+        ("Amanita muscaria", 0.6),
+    ]
+    assert tokens == 40
+
+
+def test_multi_falls_back_to_whole_frame(agent, photo, monkeypatch):
+    def fail(data, max_regions):
+        raise ImportError("❌ Pillow не установлен")
+
+    monkeypatch.setattr(identifier, "propose_regions", fail)
+    calls = respond(agent, {b"whole frame": ("Quercus robur", "средний")})
+
+    results, tokens = agent.identify_multi(photo)
+
+    assert calls == [b"whole frame"]
+    assert [r.scientific_name for r in results] == ["Quercus robur"]
+    assert tokens == 10
+
+
+def test_multi_token_sum_includes_failed_regions(agent, photo, monkeypatch):
+    use_regions(monkeypatch, [b"crop-1", b"broken"])
+    respond(agent, {b"whole frame": ("Quercus robur", "средний"), b"crop-1": ("Quercus robur", "низкий")})
+
+    results, tokens = agent.identify_multi(photo)
+
+    # Упавшая область не дает ни результата, ни токенов
+    assert [r.scientific_name for r in results] == ["Quercus robur"]
+    assert tokens == 20
+
+
+def test_multi_missing_file(agent, tmp_path):
+    results, tokens = agent.identify_multi(str(tmp_path / "missing.jpg"))
+    assert [r.scientific_name for r in results] == ["N/A"]
+    assert tokens == 0
+
+
+def test_deduplicate_keeps_first_error_when_everything_failed():
+    errors = [make_result("N/A", 0.0), make_result("N/A", 0.0)]
+    assert IdentifierAgent._deduplicate(errors) == errors[:1]
+
+
+def test_deduplicate_drops_errors_and_sorts_by_confidence():
+    results = IdentifierAgent._deduplicate([
+        make_result("N/A", 0.0),
+        make_result("B", 0.4),
+        make_result("A", 0.7),
+        make_result("b", 0.5),
+    ])
+    assert [(r.scientific_name, r.confidence) for r in results] == [("A", 0.7), ("b", 0.5)]
+
+
+# ═════════════════════════════════════════════════════════════════
+# 🖼 ОБЛАСТИ
+# ═════════════════════════════════════════════════════════════════
+
+def test_iou():
+    assert _iou((0, 0, 10, 10), (0, 0, 10, 10)) == 1.0
+    assert _iou((0, 0, 10, 10), (10, 10, 20, 20)) == 0.0
+    assert _iou((0, 0, 10, 10), (5, 0, 15, 10)) == pytest.approx(1 / 3)
+
+
+def textured_image(size=(300, 200), patches=((20, 20), (200, 120))):
+    """Ровный фон с клетчатыми (детализированными) участками 60x60"""
+    Image = pytest.importorskip("PIL.Image")
+    img = Image.new("RGB", size, (120, 160, 220))
+    for left, top in patches:
+        for x in range(left, left + 60):
+            for y in range(top, top + 60):
+                if (x // 4 + y // 4) % 2:
+                    img.putpixel((x, y), (20, 90, 20))
+    buffer = BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_propose_regions_prefers_detailed_areas():
+    data = textured_image()
+    boxes = propose_regions(data, max_regions=3)
+
+    assert 1 <= len(boxes) <= 3
+    for left, top, right, bottom in boxes:
+        assert 0 <= left < right <= 300 and 0 <= top < bottom <= 200
+    # Окна без деталей (чистый фон) отбрасываются
+    assert all(any(_iou(box, (l, t, l + 60, t + 60)) > 0 for l, t in ((20, 20), (200, 120))) for box in boxes)
+    assert all(_iou(a, b) <= 0.3 for i, a in enumerate(boxes) for b in boxes[i + 1:])
+
+
+def test_crop_regions_returns_jpeg_within_max_side():
+    Image = pytest.importorskip("PIL.Image")
+    data = textured_image()
+    crops = crop_regions(data, [(0, 0, 150, 100), (100, 50, 300, 200)], max_side=64)
+
+    assert len(crops) == 2
+    for crop in crops:
+        with Image.open(BytesIO(crop)) as img:
+            assert img.format == "JPEG"
+            assert max(img.size) <= 64
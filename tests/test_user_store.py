@@ -0,0 +1,193 @@
+# ═════════════════════════════════════════════════════════════════
+# 🧪 ТЕСТЫ: ХРАНИЛИЩЕ СОСТОЯНИЯ ПОЛЬЗОВАТЕЛЕЙ
+# ═════════════════════════════════════════════════════════════════
+
+import os
+import random
+
+import pytest
+
+from models import AnalysisMode
+from user_store import DELETED, UserStore
+
+
+@pytest.fixture
+def make_store(tmp_path):
+    stores = []
+
+    def make(**kwargs):
+        kwargs.setdefault("sweep_interval", 1e9)
+        store = UserStore(spill_path=str(tmp_path / f"spill-{len(stores)}"), **kwargs)
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        store.close()
+
+
+def evict_all(store):
+    """Вытесняет всех: last_seen всегда меньше now + 1"""
+    store.idle_ttl = -1
+    evicted = store.sweep()
+    store.idle_ttl = 86400
+    return evicted
+
+
+def test_ensure_get_and_modes(make_store):
+    store = make_store()
+    assert store.get(1) is None
+    assert store.get_mode(1, AnalysisMode.FREE) == AnalysisMode.FREE
+
+    user = store.ensure(1, AnalysisMode.FREE)
+    assert user.user_id == 1 and user.mode == AnalysisMode.FREE
+    store.set_mode(1, AnalysisMode.MULTI)
+    store.add_usage(1, images=2, tokens=300)
+
+    user = store.get(1)
+    assert (user.mode, user.total_images, user.total_tokens_used) == (AnalysisMode.MULTI, 2, 300)
+    assert 1 in store and 2 not in store
+
+
+def test_resize_keeps_all_users(make_store):
+    store = make_store(initial_capacity=8)
+    for uid in range(1, 1001):
+        store.add_usage(uid, images=1, tokens=uid)
+
+    assert store._capacity == 2048
+    assert store._used == 1000
+    assert all(store.get(uid).total_tokens_used == uid for uid in range(1, 1001))
+
+
+def test_deleted_slot_is_reused(make_store):
+    store = make_store(initial_capacity=8)
+    store.ensure(5)
+    filled = store._filled
+
+    assert evict_all(store) == 1
+    assert DELETED in store._ids
+    assert store._used == 0 and store._filled == filled
+
+    # Перезагрузка с диска занимает слот DELETED, а не новый пустой
+    assert store.get(5) is not None
+    assert store._used == 1 and store._filled == filled
+
+
+def test_sweep_evicts_only_idle_users_and_reloads(make_store):
+    store = make_store()
+    store.set_mode(1, AnalysisMode.FREE)
+    store.add_usage(1, images=3, tokens=30)
+    store.ensure(2)
+
+    store._last_seen[store._find(1)] -= 10
+    store.idle_ttl = 5
+    assert store.sweep() == 1
+    assert store._find(1) < 0 and store._find(2) >= 0
+    assert store.users_spilled == 1
+    assert 1 in store
+
+    user = store.get(1)
+    assert (user.mode, user.total_images, user.total_tokens_used) == (AnalysisMode.FREE, 3, 30)
+    assert store.users_spilled == 0
+    assert store._find(1) >= 0
+
+
+def test_many_deleted_markers_trigger_rebuild(make_store):
+    store = make_store(initial_capacity=64)
+    for uid in range(1, 41):
+        store.ensure(uid)
+    evict_all(store)
+
+    # Маркеры DELETED вычищены перестройкой таблицы
+    assert store._filled == store._used == 0
+    assert DELETED not in store._ids
+    assert all(store.get(uid) is not None for uid in range(1, 41))
+
+
+def test_aggregates_match_reference(make_store):
+    store = make_store(initial_capacity=8)
+    rng = random.Random(7)
+    reference = {}
+
+    for step in range(5000):
+        uid = rng.randrange(1, 600)
+        action = rng.random()
+        if action < 0.4:
+            mode = rng.choice(list(AnalysisMode))
+            store.set_mode(uid, mode)
+            reference.setdefault(uid, [mode, 0, 0])[0] = mode
+        elif action < 0.8:
+            images, tokens = rng.randrange(1, 4), rng.randrange(0, 1000)
+            store.add_usage(uid, images, tokens)
+            entry = reference.setdefault(uid, [AnalysisMode.PAID, 0, 0])
+            entry[1] += images
+            entry[2] += tokens
+        else:
+            user = store.get(uid)
+            if uid in reference:
+                assert (user.mode, user.total_images, user.total_tokens_used) == tuple(reference[uid])
+            else:
+                assert user is None
+        if step % 700 == 0:
+            evict_all(store)
+
+    stats = store.global_stats()
+    assert stats["users_total"] == len(reference)
+    assert stats["users_in_memory"] + stats["users_spilled"] == len(reference)
+    assert stats["images_total"] == sum(entry[1] for entry in reference.values())
+    assert stats["tokens_total"] == sum(entry[2] for entry in reference.values())
+    for mode in AnalysisMode:
+        assert stats["users_by_mode"][mode] == sum(1 for entry in reference.values() if entry[0] == mode)
+
+
+def test_table_shrinks_after_eviction(make_store):
+    store = make_store(initial_capacity=64, migrate_chunk=256)
+    for uid in range(1, 20001):
+        store.ensure(uid)
+    peak = store.global_stats()["memory_bytes"]
+
+    evict_all(store)
+    # Перестройка идет порциями при обращениях
+    while store._old is not None:
+        store.get(10 ** 9)
+
+    assert store._capacity == 64
+    assert store.global_stats()["memory_bytes"] < peak / 100
+    assert store.get(12345) is not None
+
+
+def test_incremental_resize_keeps_users_reachable(make_store):
+    store = make_store(initial_capacity=8, migrate_chunk=4)
+    for uid in range(1, 3001):
+        store.add_usage(uid, images=1, tokens=uid)
+        # Во время переноса пользователи доступны из обеих таблиц
+        assert store.get(uid // 2 + 1) is not None
+
+    assert store.global_stats()["users_in_memory"] == 3000
+    assert all(store.get(uid).total_tokens_used == uid for uid in range(1, 3001))
+    store.sweep()
+    assert store._old is None and store._used == 3000
+
+
+def test_sweep_chunk_evicts_in_one_transaction(make_store):
+    store = make_store()
+    for uid in range(1, 101):
+        store.ensure(uid)
+
+    statements = []
+    store._spill.set_trace_callback(statements.append)
+    store.idle_ttl = -1
+    assert store.sweep() == 100
+    assert statements.count("BEGIN ") + statements.count("BEGIN") == 1
+
+
+def test_check_from_env_keeps_live_spill_file(make_store, tmp_path, monkeypatch):
+    store = make_store()
+    store.ensure(1)
+    evict_all(store)
+    size = os.path.getsize(store.spill_path)
+
+    monkeypatch.setenv("USER_SPILL_PATH", store.spill_path)
+    assert UserStore.check_from_env() == store.spill_path
+    assert os.path.getsize(store.spill_path) == size
+    assert store.get(1) is not None
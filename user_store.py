@@ -0,0 +1,431 @@
+# ═════════════════════════════════════════════════════════════════
+# 🌿 PLANT RECOGNITION BOT - USER STORE
+# ═════════════════════════════════════════════════════════════════
+# Компактное хранилище состояния пользователей
+# ═════════════════════════════════════════════════════════════════
+#
+# Память на 1M пользователей в оперативной памяти:
+#
+#   dict[int, dict] (как было)       ~260 МБ  (~260 байт/польз.)
+#   UserStore                        ~52 МБ   (2^21 слотов x 25 байт)
+#
+# Емкость таблицы - степень двойки и удваивается при заполнении MAX_LOAD
+# (0.7), поэтому 1M пользователей всегда занимают 2^21 слотов.
+#
+# Слот таблицы: user_id (8) + mode (1) + images (4) + tokens (8)
+# + last_seen (4) = 25 байт. Неактивные пользователи вытесняются на
+# диск (~40 байт/польз. в SQLite), после чего таблица постепенно
+# перестраивается под оставшихся и освобождает память.
+# ═════════════════════════════════════════════════════════════════
+
+import os
+import time
+import sqlite3
+import tempfile
+from array import array
+from typing import List, Optional
+
+from models import AnalysisMode, UserData
+
+
+# Коды режимов в колонке mode
+MODES = tuple(AnalysisMode)
+MODE_CODES = {mode: code for code, mode in enumerate(MODES)}
+
+# Маркеры в колонке user_id
+EMPTY = 0
+DELETED = -1
+
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+
+class UserStore:
+    """
+    Состояние пользователей в колонках array с открытой адресацией
+
+    Вместо словаря словарей каждая колонка (mode, images, tokens,
+    last_seen) - плотный array, позиция пользователя находится
+    линейным пробированием по колонке user_id. Пользователи, неактивные
+    дольше idle_ttl, вытесняются в SQLite файл и загружаются обратно при
+    следующем обращении. Таблица растет и сжимается под число живых
+    записей; перенос в новую таблицу идет порциями по migrate_chunk
+    слотов при каждом обращении. Глобальные агрегаты для /globalstats
+    поддерживаются инкрементально.
+
+    Файл вытеснения создается заново при старте: состояние живет
+    столько же, сколько процесс, как и раньше.
+    """
+
+    MAX_LOAD = 0.7
+
+    def __init__(
+        self,
+        spill_path: Optional[str] = None,
+        idle_ttl: float = 86400.0,
+        initial_capacity: int = 1024,
+        sweep_chunk: int = 4096,
+        sweep_interval: float = 1.0,
+        migrate_chunk: int = 1024
+    ):
+        self.idle_ttl = idle_ttl
+        self.sweep_chunk = sweep_chunk
+        self.migrate_chunk = migrate_chunk
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        self.spill_path = spill_path or self.default_spill_path()
+        self._spill = self._open_spill(self.spill_path)
+
+        capacity = 1
+        while capacity < initial_capacity:
+            capacity <<= 1
+        self._min_capacity = capacity
+        self._allocate(capacity)
+        self._sweep_cursor = 0
+
+        # Старая таблица во время постепенной перестройки (см. _resize)
+        self._old: Optional[tuple] = None
+        self._old_shift = 0
+        self._old_used = 0
+        self._migrate_cursor = 0
+
+        # Глобальные агрегаты
+        self.users_total = 0
+        self.users_spilled = 0
+        self.users_by_mode = [0] * len(MODES)
+        self.images_total = 0
+        self.tokens_total = 0
+
+    @staticmethod
+    def default_spill_path() -> str:
+        return os.path.join(tempfile.gettempdir(), "florabot_users")
+
+    @classmethod
+    def check_from_env(cls) -> str:
+        """
+        Проверяет настройки хранилища, ничего не меняя на диске
+
+        Файл вытеснения работающего бота не открывается: проверяется
+        только, что его каталог доступен на запись.
+        """
+        spill_path = os.getenv("USER_SPILL_PATH") or cls.default_spill_path()
+        directory = os.path.dirname(os.path.abspath(spill_path))
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(f"нет каталога {directory}")
+        if not os.access(directory, os.W_OK):
+            raise PermissionError(f"нет прав на запись в {directory}")
+        return spill_path
+
+    @classmethod
+    def from_env(cls) -> "UserStore":
+        """Создает хранилище с параметрами из переменных окружения"""
+        return cls(
+            spill_path=os.getenv("USER_SPILL_PATH"),
+            idle_ttl=float(os.getenv("USER_IDLE_TTL", 86400)),
+            initial_capacity=int(os.getenv("USER_STORE_CAPACITY", 1024))
+        )
+
+    # ═════════════════════════════════════════════════════════════════
+    # 🧱 ТАБЛИЦА
+    # ═════════════════════════════════════════════════════════════════
+
+    def _allocate(self, capacity: int):
+        """Создает пустые колонки заданной емкости (степень двойки)"""
+        self._capacity = capacity
+        self._shift = 64 - (capacity.bit_length() - 1)
+        self._used = 0          # Живые записи
+        self._filled = 0        # Живые записи + DELETED
+        self._ids = array("q", bytes(8 * capacity))
+        self._modes = array("B", bytes(capacity))
+        self._images = array("I", bytes(4 * capacity))
+        self._tokens = array("Q", bytes(8 * capacity))
+        self._last_seen = array("I", bytes(4 * capacity))
+
+    @staticmethod
+    def _home(user_id: int, shift: int) -> int:
+        """Начальная позиция (фибоначчиево хеширование)"""
+        return ((user_id * _HASH_MULTIPLIER) & _MASK64) >> shift
+
+    @staticmethod
+    def _probe(ids: array, shift: int, user_id: int) -> int:
+        """Позиция пользователя в колонке ids или -1"""
+        mask = len(ids) - 1
+        pos = UserStore._home(user_id, shift)
+        while True:
+            current = ids[pos]
+            if current == user_id:
+                return pos
+            if current == EMPTY:
+                return -1
+            pos = (pos + 1) & mask
+
+    def _find(self, user_id: int) -> int:
+        """Позиция пользователя в таблице или -1 (переносит из старой таблицы)"""
+        pos = self._probe(self._ids, self._shift, user_id)
+        if pos >= 0 or self._old is None:
+            return pos
+
+        old_pos = self._probe(self._old[0], self._old_shift, user_id)
+        return self._migrate_slot(old_pos) if old_pos >= 0 else -1
+
+    def _insert(self, user_id: int, mode: int, images: int, tokens: int, last_seen: int) -> int:
+        """Вставляет запись (пользователя в таблице еще нет)"""
+        if (self._filled + 1) > self._capacity * self.MAX_LOAD:
+            self._resize()
+        return self._place(user_id, mode, images, tokens, last_seen)
+
+    def _place(self, user_id: int, mode: int, images: int, tokens: int, last_seen: int) -> int:
+        """Кладет запись в первый свободный слот без проверки заполнения"""
+        mask = self._capacity - 1
+        pos = self._home(user_id, self._shift)
+        ids = self._ids
+        while ids[pos] > 0:
+            pos = (pos + 1) & mask
+
+        if ids[pos] == EMPTY:
+            self._filled += 1
+        self._used += 1
+        ids[pos] = user_id
+        self._modes[pos] = mode
+        self._images[pos] = images
+        self._tokens[pos] = tokens
+        self._last_seen[pos] = last_seen
+        return pos
+
+    def _remove(self, pos: int):
+        """Удаляет запись, оставляя маркер DELETED"""
+        self._ids[pos] = DELETED
+        self._used -= 1
+
+    def _resize(self):
+        """
+        Начинает перестройку таблицы под текущее число живых записей
+
+        Новая емкость - наименьшая степень двойки (не меньше начальной),
+        при которой заполнение не выше MAX_LOAD / 2: таблица растет при
+        заполнении и сжимается, когда пользователи вытеснены. Записи
+        переносятся постепенно (_migrate), поэтому обращение, запустившее
+        перестройку, не ждет обхода всей таблицы.
+        """
+        self._finish_migration()
+        live = self._used
+        capacity = self._min_capacity
+        while live + 1 > capacity * self.MAX_LOAD / 2:
+            capacity <<= 1
+
+        self._old = (self._ids, self._modes, self._images, self._tokens, self._last_seen)
+        self._old_shift = self._shift
+        self._old_used = live
+        self._migrate_cursor = 0
+        self._allocate(capacity)
+        self._sweep_cursor = 0
+
+    def _migrate_slot(self, old_pos: int) -> int:
+        """Переносит запись из старой таблицы в новую"""
+        ids, modes, images, tokens, last_seen = self._old
+        pos = self._place(ids[old_pos], modes[old_pos], images[old_pos], tokens[old_pos], last_seen[old_pos])
+        ids[old_pos] = DELETED
+        self._old_used -= 1
+        return pos
+
+    def _migrate(self, limit: int):
+        """Переносит записи из не более чем limit слотов старой таблицы"""
+        ids = self._old[0]
+        end = min(self._migrate_cursor + limit, len(ids))
+        for old_pos in range(self._migrate_cursor, end):
+            if ids[old_pos] > 0:
+                self._migrate_slot(old_pos)
+        self._migrate_cursor = end
+        if end == len(ids):
+            self._old = None
+
+    def _finish_migration(self):
+        """Завершает перенос из старой таблицы, если он идет"""
+        if self._old is not None:
+            self._migrate(len(self._old[0]))
+
+    # ═════════════════════════════════════════════════════════════════
+    # 💾 ВЫТЕСНЕНИЕ
+    # ═════════════════════════════════════════════════════════════════
+
+    @staticmethod
+    def _open_spill(path: str) -> sqlite3.Connection:
+        """Создает пустой файл вытеснения"""
+        if os.path.exists(path):
+            os.remove(path)
+        conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(
+            "CREATE TABLE users ("
+            "user_id INTEGER PRIMARY KEY, mode INTEGER, images INTEGER, "
+            "tokens INTEGER, last_seen INTEGER)"
+        )
+        return conn
+
+    def _locate(self, user_id: int) -> int:
+        """Позиция пользователя, при необходимости загруженного с диска"""
+        pos = self._find(user_id)
+        if pos >= 0 or not self.users_spilled:
+            return pos
+
+        row = self._spill.execute(
+            "SELECT mode, images, tokens, last_seen FROM users WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()
+        if row is None:
+            return -1
+
+        self._spill.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
+        self.users_spilled -= 1
+        return self._insert(user_id, *row)
+
+    def _evict(self, positions: List[int]):
+        """Переносит записи в файл вытеснения одной транзакцией"""
+        rows = [
+            (self._ids[pos], self._modes[pos], self._images[pos], self._tokens[pos], self._last_seen[pos])
+            for pos in positions
+        ]
+        self._spill.execute("BEGIN")
+        self._spill.executemany("INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?, ?)", rows)
+        self._spill.execute("COMMIT")
+        for pos in positions:
+            self._remove(pos)
+        self.users_spilled += len(positions)
+
+    def sweep(self, limit: Optional[int] = None) -> int:
+        """
+        Вытесняет неактивных пользователей
+
+        Проходит не более limit позиций таблицы начиная с курсора, так что
+        частые маленькие вызовы постепенно обходят всю таблицу. При
+        обращениях к хранилищу вызывается не чаще раза в sweep_interval.
+
+        Returns:
+            Количество вытесненных пользователей
+        """
+        if self._old is not None:
+            self._migrate(len(self._old[0]) if limit is None else limit)
+
+        limit = self._capacity if limit is None else min(limit, self._capacity)
+        cutoff = int(time.time() - self.idle_ttl)
+        mask = self._capacity - 1
+        pos = self._sweep_cursor
+        idle = []
+
+        for _ in range(limit):
+            if self._ids[pos] > 0 and self._last_seen[pos] < cutoff:
+                idle.append(pos)
+            pos = (pos + 1) & mask
+
+        if idle:
+            self._evict(idle)
+        self._sweep_cursor = pos
+
+        # Много маркеров DELETED замедляют поиск, а вытесненные пользователи
+        # не должны держать память - перестраиваем (и сжимаем) таблицу
+        if self._old is None and self._filled - self._used > self._capacity // 4:
+            self._resize()
+
+        return len(idle)
+
+    # ═════════════════════════════════════════════════════════════════
+    # 👤 ПОЛЬЗОВАТЕЛИ
+    # ═════════════════════════════════════════════════════════════════
+
+    def _touch(self, user_id: int, create_mode: Optional[AnalysisMode] = None) -> int:
+        """Позиция пользователя с обновлением last_seen (создает при create_mode)"""
+        if self._old is not None:
+            self._migrate(self.migrate_chunk)
+
+        now = time.time()
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now
+            self.sweep(self.sweep_chunk)
+
+        now = int(now)
+        pos = self._locate(user_id)
+        if pos < 0:
+            if create_mode is None:
+                return -1
+            code = MODE_CODES[create_mode]
+            pos = self._insert(user_id, code, 0, 0, now)
+            self.users_total += 1
+            self.users_by_mode[code] += 1
+        self._last_seen[pos] = now
+        return pos
+
+    def __contains__(self, user_id: int) -> bool:
+        if self._find(user_id) >= 0:
+            return True
+        return self._spill.execute(
+            "SELECT 1 FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self.users_total
+
+    def get(self, user_id: int) -> Optional[UserData]:
+        """Данные пользователя или None"""
+        pos = self._touch(user_id)
+        return self._view(user_id, pos) if pos >= 0 else None
+
+    def ensure(self, user_id: int, mode: AnalysisMode = AnalysisMode.PAID) -> UserData:
+        """Данные пользователя, создает запись с режимом mode если ее нет"""
+        return self._view(user_id, self._touch(user_id, create_mode=mode))
+
+    def _view(self, user_id: int, pos: int) -> UserData:
+        """Снимок записи в виде UserData"""
+        return UserData(
+            user_id=user_id,
+            mode=MODES[self._modes[pos]],
+            total_images=self._images[pos],
+            total_tokens_used=self._tokens[pos]
+        )
+
+    def get_mode(self, user_id: int, default: AnalysisMode = AnalysisMode.PAID) -> AnalysisMode:
+        """Режим пользователя"""
+        pos = self._touch(user_id)
+        return MODES[self._modes[pos]] if pos >= 0 else default
+
+    def set_mode(self, user_id: int, mode: AnalysisMode):
+        """Устанавливает режим, создает пользователя если нужно"""
+        pos = self._touch(user_id, create_mode=mode)
+        code = MODE_CODES[mode]
+        old_code = self._modes[pos]
+        if old_code != code:
+            self.users_by_mode[old_code] -= 1
+            self.users_by_mode[code] += 1
+            self._modes[pos] = code
+
+    def add_usage(self, user_id: int, images: int, tokens: int):
+        """Добавляет обработанные фото и токены"""
+        pos = self._touch(user_id, create_mode=AnalysisMode.PAID)
+        self._images[pos] += images
+        self._tokens[pos] += tokens
+        self.images_total += images
+        self.tokens_total += tokens
+
+    # ═════════════════════════════════════════════════════════════════
+    # 📊 АГРЕГАТЫ
+    # ═════════════════════════════════════════════════════════════════
+
+    def global_stats(self) -> dict:
+        """Глобальная статистика за O(1)"""
+        return {
+            "users_total": self.users_total,
+            "users_in_memory": self._used + self._old_used,
+            "users_spilled": self.users_spilled,
+            "users_by_mode": {mode: self.users_by_mode[code] for code, mode in enumerate(MODES)},
+            "images_total": self.images_total,
+            "tokens_total": self.tokens_total,
+            "memory_bytes": sum(
+                col.itemsize * len(col)
+                for col in (self._ids, self._modes, self._images, self._tokens, self._last_seen)
+                + (self._old or ())
+            )
+        }
+
+    def close(self):
+        """Закрывает файл вытеснения"""
+        self._spill.close()